@@ -0,0 +1,16 @@
+import pytest
+from core.querybudget import assert_query_budget
+from django.core.cache import cache
+
+
+@pytest.fixture
+def query_budget(monkeypatch):
+    """Проверяет, что view укладывается в бюджет SQL-запросов из urls.py
+    при заданном числе постов на странице."""
+    def check(client, view_name, kwargs=None, per_page=None, data=None):
+        if per_page is not None:
+            monkeypatch.setattr('posts.views.POST_CNT', per_page)
+        # Холодный кэш фрагментов: считаются все запросы рендера.
+        cache.clear()
+        return assert_query_budget(client, view_name, kwargs, data)
+    return check
@@ -3,6 +3,7 @@ import tempfile
 import pytest
 from mixer.backend.django import mixer as _mixer
 from posts.models import Post, Group
+from posts.thumbnails import wait_for_pending
 
 
 @pytest.fixture()
@@ -10,6 +11,8 @@ def mock_media(settings):
     with tempfile.TemporaryDirectory() as temp_directory:
         settings.MEDIA_ROOT = temp_directory
         yield temp_directory
+        # Миниатюры пишутся в фоне: ждем их до удаления каталога.
+        wait_for_pending()
 
 
 @pytest.fixture
@@ -0,0 +1,10 @@
+import pytest
+from core.testrunner import temporary_files
+
+
+@pytest.fixture(scope='session', autouse=True)
+def isolated_files():
+    """Кэш и другие файлы проекта на время тестов — во временном
+    каталоге."""
+    with temporary_files():
+        yield
@@ -0,0 +1,22 @@
+import pytest
+from posts.models import Follow, Post
+
+pytestmark = [pytest.mark.django_db]
+
+
+@pytest.fixture
+def followed_posts(mixer, user, another_user):
+    Follow.objects.create(user=user, author=another_user)
+    return mixer.cycle(110).blend(Post, author=another_user, image='')
+
+
+class TestQueryBudgets:
+
+    @pytest.mark.parametrize('per_page', [10, 100])
+    @pytest.mark.parametrize('view_name', ['posts:index', 'posts:follow_index'])
+    def test_feed_within_budget(self, user_client, followed_posts, query_budget, view_name, per_page):
+        response = query_budget(user_client, view_name, per_page=per_page)
+        assert response.status_code == 200
+        assert len(response.context['page_obj']) == per_page, (
+            f'Проверьте, что на странице `{view_name}` выводится {per_page} постов'
+        )
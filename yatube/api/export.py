@@ -0,0 +1,71 @@
+"""Выгрузка постов и комментариев в NDJSON: один JSON-объект на строку.
+
+Посты обходятся по возрастанию id пачками по chunk_size, каждая пачка —
+отдельный запрос pk > последнего id, так что память не зависит от
+размера таблицы. Строки имеют вид {"type": "post", "data": {...}}, после
+поста идут его комментарии ({"type": "comment", ...}), а после каждой
+пачки — строка {"type": "cursor", "cursor": "<id>"}. Оборванную выгрузку
+можно продолжить с последнего полученного курсора.
+"""
+import json
+
+from posts.models import Comment, Post
+from rest_framework.utils.encoders import JSONEncoder
+
+from .serializers import CommentSerializer, PostSerializer
+
+EXPORT_CHUNK_SIZE = 500
+MAX_EXPORT_CHUNK_SIZE = 5000
+
+
+def parse_cursor(cursor):
+    """id, после которого продолжать выгрузку; None для неверного курсора."""
+    if not cursor:
+        return 0
+    try:
+        last_pk = int(cursor)
+    except (TypeError, ValueError):
+        return None
+    return last_pk if last_pk >= 0 else None
+
+
+def ndjson_line(record_type, data):
+    record = {'type': record_type, 'data': data}
+    return json.dumps(record, cls=JSONEncoder, ensure_ascii=False) + '\n'
+
+
+def cursor_line(last_pk):
+    return json.dumps({'type': 'cursor', 'cursor': str(last_pk)}) + '\n'
+
+
+def export_lines(last_pk=0, chunk_size=EXPORT_CHUNK_SIZE, comments=False,
+                 request=None):
+    """Генератор строк NDJSON с постами после last_pk."""
+    # Выгрузка читает каждый объект один раз: кэш представлений API она
+    # бы только вытесняла.
+    context = {'request': request, 'cache_representation': False}
+    posts = PostSerializer(many=True, context=context)
+    post_comments = CommentSerializer(many=True, context=context)
+    while True:
+        chunk = list(
+            Post.objects.filter(pk__gt=last_pk).select_related(
+                'author'
+            ).order_by('pk')[:chunk_size]
+        )
+        if not chunk:
+            return
+        comments_by_post = {}
+        if comments:
+            rows = list(Comment.objects.filter(
+                post_id__in=[post.pk for post in chunk]
+            ).select_related('author').order_by('post_id', 'pk'))
+            for comment, data in zip(
+                rows, post_comments.to_representation(rows)
+            ):
+                comments_by_post.setdefault(comment.post_id, []).append(data)
+        for post, data in zip(chunk, posts.to_representation(chunk)):
+            yield ndjson_line('post', data)
+            for comment in comments_by_post.get(post.pk, ()):
+                yield ndjson_line('comment', comment)
+        last_pk = chunk[-1].pk
+        yield cursor_line(last_pk)
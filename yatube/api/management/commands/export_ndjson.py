@@ -0,0 +1,87 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.export import (EXPORT_CHUNK_SIZE, cursor_line, export_lines,
+                        parse_cursor)
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает посты (и по желанию комментарии) в NDJSON пачками с '
+        'постоянным расходом памяти. Прерванную выгрузку можно продолжить '
+        'с курсора в тот же файл: все, что записано после строки курсора, '
+        'отбрасывается и выгружается заново.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', '-o',
+            help='Файл для выгрузки, по умолчанию stdout.'
+        )
+        parser.add_argument(
+            '--cursor',
+            help='Курсор, с которого продолжить выгрузку.'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=EXPORT_CHUNK_SIZE,
+            help='Сколько постов читать одним запросом.'
+        )
+        parser.add_argument(
+            '--comments', action='store_true',
+            help='Выгружать комментарии после каждого поста.'
+        )
+
+    def handle(self, *args, output, cursor, chunk_size, comments,
+               **options):
+        last_pk = parse_cursor(cursor)
+        if last_pk is None:
+            raise CommandError(f'Неверный курсор: {cursor}')
+        if chunk_size <= 0:
+            raise CommandError('--chunk-size должен быть больше нуля')
+        lines = export_lines(last_pk, chunk_size=chunk_size, comments=comments)
+        if output:
+            # С курсором выгрузка дописывается к уже полученной части.
+            if last_pk:
+                self.truncate(output, last_pk)
+            with open(output, 'a' if last_pk else 'w',
+                      encoding='utf-8') as stream:
+                self.export(lines, stream)
+        else:
+            self.export(lines, self.stdout)
+
+    def truncate(self, path, last_pk):
+        """Обрезает файл после строки курсора last_pk.
+
+        Хвост за ней — оборванная пачка; после обрезки она выгрузится
+        заново целиком, без обрывков и повторов.
+        """
+        marker = cursor_line(last_pk).encode()
+        end = None
+        try:
+            with open(path, 'rb+') as stream:
+                offset = 0
+                for line in stream:
+                    offset += len(line)
+                    if line == marker:
+                        end = offset
+                if end is None:
+                    raise CommandError(
+                        f'В {path} нет курсора {last_pk}: продолжить '
+                        f'выгрузку в этот файл нельзя'
+                    )
+                stream.truncate(end)
+        except FileNotFoundError:
+            raise CommandError(f'Нет файла {path} для продолжения выгрузки')
+
+    def export(self, lines, stream):
+        rows = 0
+        cursor = None
+        for line in lines:
+            if line.startswith('{"type": "cursor"'):
+                cursor = json.loads(line)['cursor']
+                self.stderr.write(f'Выгружено строк: {rows}, курсор: {cursor}')
+            else:
+                rows += 1
+            stream.write(line)
+        self.stderr.write(f'Готово, строк: {rows}, последний курсор: {cursor}')
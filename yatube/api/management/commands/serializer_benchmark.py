@@ -0,0 +1,66 @@
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from posts.models import Post
+from rest_framework import serializers
+
+from api.serializers import PostSerializer
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает время сериализации списка постов обычным '
+        'ListSerializer DRF, FastListSerializer и FastListSerializer с '
+        'кэшем представлений. Посты строятся в памяти, база данных не '
+        'нужна.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--posts', type=int, default=100,
+            help='Сколько постов в одном списке.'
+        )
+        parser.add_argument(
+            '--iterations', type=int, default=200,
+            help='Сколько раз сериализовать список.'
+        )
+
+    def handle(self, *args, posts, iterations, **options):
+        now = timezone.now()
+        author = User(id=1, username='author')
+        object_list = [
+            Post(
+                id=i, author=author, text='Текст поста ' * 20,
+                pub_date=now, updated=now, group_id=i % 5 or None,
+                image=f'posts/{i}.jpg' if i % 2 else ''
+            )
+            for i in range(posts)
+        ]
+        uncached = {'cache_representation': False}
+        variants = {
+            'drf': lambda: serializers.ListSerializer(
+                object_list, child=PostSerializer(), context=uncached
+            ).data,
+            'fast': lambda: PostSerializer(
+                object_list, many=True, context=uncached
+            ).data,
+            'cached': lambda: PostSerializer(object_list, many=True).data,
+        }
+        for name, serialize in variants.items():
+            timings = []
+            for _ in range(iterations):
+                start = time.perf_counter()
+                serialize()
+                timings.append((time.perf_counter() - start) * 1e3)
+            timings.sort()
+            self.stdout.write(
+                f'{name:>6}: '
+                f'p50 {statistics.median(timings):.2f} мс, '
+                f'p99 {timings[int(len(timings) * 0.99)]:.2f} мс '
+                f'на {posts} постов'
+            )
@@ -1,23 +1,198 @@
+import hashlib
+from operator import attrgetter
+
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import models
+from django.utils.functional import cached_property
+from posts.bulk import bulk_create_comments, bulk_create_posts
 from posts.models import Comment, Follow, Group, Post
 from rest_framework import serializers
+from rest_framework.relations import PrimaryKeyRelatedField
 from rest_framework.validators import UniqueTogetherValidator
 
 
 User = get_user_model()
 
+REPRESENTATION_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+class FastListSerializer(serializers.ListSerializer):
+    """Сериализация списка без обхода полей DRF для каждого объекта.
+
+    Способ чтения и to_representation каждого поля выбираются один раз
+    на список. Внешние ключи, для которых DRF отдает только pk, читаются
+    из колонки <поле>_id без загрузки связанного объекта. Результат
+    совпадает с обычным ListSerializer.
+    """
+
+    def field_readers(self):
+        readers = []
+        for field in self.child._readable_fields:
+            if (isinstance(field, PrimaryKeyRelatedField)
+                    and field.pk_field is None
+                    and len(field.source_attrs) == 1):
+                readers.append((
+                    field.field_name,
+                    attrgetter(field.source_attrs[0] + '_id'),
+                    None
+                ))
+            elif field.source_attrs:
+                readers.append((
+                    field.field_name,
+                    attrgetter('.'.join(field.source_attrs)),
+                    field.to_representation
+                ))
+            else:
+                readers.append((
+                    field.field_name,
+                    field.get_attribute,
+                    field.to_representation
+                ))
+        return readers
+
+    def serialize(self, instances):
+        readers = self.field_readers()
+        rows = []
+        for instance in instances:
+            row = {}
+            for name, read, to_representation in readers:
+                value = read(instance)
+                if value is not None and to_representation is not None:
+                    value = to_representation(value)
+                row[name] = value
+            rows.append(row)
+        return rows
+
+    def to_representation(self, data):
+        if isinstance(data, models.Manager):
+            data = data.all()
+        if not getattr(self.child, 'representation_cacheable', False):
+            return self.serialize(data)
+        # Готовые представления читаются одним get_many, сериализуются
+        # только промахи.
+        data = list(data)
+        keys = [self.child.representation_cache_key(item) for item in data]
+        cached = cache.get_many(keys)
+        missing = [
+            (key, item) for key, item in zip(keys, data) if key not in cached
+        ]
+        if missing:
+            fresh = dict(zip(
+                (key for key, _ in missing),
+                self.serialize(item for _, item in missing)
+            ))
+            cache.set_many(fresh, REPRESENTATION_CACHE_TIMEOUT)
+            cached.update(fresh)
+        return [cached[key] for key in keys]
+
+    def create(self, validated_data):
+        """Все объекты списка создаются одним bulk_create дочернего
+        сериализатора, а не save() каждого."""
+        model = self.child.Meta.model
+        return self.child.bulk_create(
+            [model(**attrs) for attrs in validated_data]
+        )
+
+
+class CachedRepresentationMixin:
+    """Кэш готового представления объекта.
+
+    Ключ состоит из pk, версии объекта (cache_version), набора полей и
+    адреса сайта, от которого зависят ссылки на картинки: сохранение
+    объекта или другой ?fields= дают новый ключ. Вложенные по ?include=
+    объекты в версию не входят, поэтому такие ответы не кэшируются.
+    """
+
+    def cache_version(self, instance):
+        return (instance.updated.timestamp(),)
+
+    @property
+    def representation_cacheable(self):
+        return (
+            self.context.get('cache_representation', True)
+            and not getattr(self, 'included', ())
+        )
 
-class PostSerializer(serializers.ModelSerializer):
+    @cached_property
+    def representation_cache_prefix(self):
+        request = self.context.get('request')
+        site = request.build_absolute_uri('/') if request else ''
+        names = ','.join(field.field_name for field in self._readable_fields)
+        digest = hashlib.md5(f'{site}|{names}'.encode()).hexdigest()
+        return f'api:{self.Meta.model._meta.label_lower}:{digest}'
+
+    def representation_cache_key(self, instance):
+        version = '|'.join(
+            str(value) for value in self.cache_version(instance)
+        )
+        digest = hashlib.md5(version.encode()).hexdigest()
+        return f'{self.representation_cache_prefix}:{instance.pk}:{digest}'
+
+    def to_representation(self, instance):
+        if not self.representation_cacheable:
+            return super().to_representation(instance)
+        key = self.representation_cache_key(instance)
+        data = cache.get(key)
+        if data is None:
+            data = super().to_representation(instance)
+            cache.set(key, data, REPRESENTATION_CACHE_TIMEOUT)
+        return data
+
+
+class SparseFieldsMixin:
+    """Поля ответа по параметрам запроса.
+
+    fields — какие поля оставить в ответе, include — какие связи вложить
+    целиком вместо id (из include_fields). Связанные объекты выбирает
+    view через prefetch_related.
+    """
+    include_fields = {}
+
+    def __init__(self, *args, fields=None, include=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        include = [name for name in include if name in self.include_fields]
+        self.included = include
+        for name in include:
+            self.fields[name] = self.include_fields[name]()
+        if fields:
+            keep = set(fields) | set(include)
+            for name in list(self.fields):
+                if name not in keep:
+                    self.fields.pop(name)
+
+
+class PostSerializer(CachedRepresentationMixin, SparseFieldsMixin,
+                     serializers.ModelSerializer):
     author = serializers.SlugRelatedField(
         read_only=True,
         slug_field='username')
+    include_fields = {
+        'group': lambda: GroupSerializer(read_only=True),
+        'comments': lambda: CommentSerializer(many=True, read_only=True),
+    }
 
     class Meta:
         fields = '__all__'
         model = Post
+        list_serializer_class = FastListSerializer
+
+    def cache_version(self, instance):
+        # Счетчик и флаг версий картинки меняются через update(), а имя
+        # автора — в другой таблице: updated их не отражает.
+        return (
+            instance.updated.timestamp(),
+            instance.comment_count,
+            instance.image_variants,
+            instance.author.username,
+        )
 
+    def bulk_create(self, posts):
+        return bulk_create_posts(posts)
 
-class CommentSerializer(serializers.ModelSerializer):
+
+class CommentSerializer(CachedRepresentationMixin, SparseFieldsMixin,
+                        serializers.ModelSerializer):
     author = serializers.SlugRelatedField(
         read_only=True,
         slug_field='username')
@@ -25,6 +200,13 @@ class CommentSerializer(serializers.ModelSerializer):
     class Meta:
         fields = '__all__'
         model = Comment
+        list_serializer_class = FastListSerializer
+
+    def cache_version(self, instance):
+        return (instance.updated.timestamp(), instance.author.username)
+
+    def bulk_create(self, comments):
+        return bulk_create_comments(comments)
 
 
 class GroupSerializer(serializers.ModelSerializer):
@@ -0,0 +1,367 @@
+import json
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from django.utils import timezone
+from core.querybudget import assert_query_budget
+from posts.counters import user_stats
+from posts.models import Comment, Follow, Group, Post, TimelineEntry
+from posts.search import search_posts
+from rest_framework import serializers
+from rest_framework.test import APIClient
+
+from .serializers import PostSerializer
+
+User = get_user_model()
+
+
+class PostListTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author')
+        group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        Post.objects.bulk_create(
+            Post(author=cls.user, text=f'Пост {i}', group=group)
+            for i in range(15)
+        )
+        # Половина постов с одинаковой датой: порядок решает id.
+        now = timezone.now()
+        for i, post in enumerate(Post.objects.order_by('id')):
+            post.pub_date = now - timedelta(days=min(i, 7))
+            post.save(update_fields=['pub_date'])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_cursor_pagination(self):
+        """Страницы по курсору идут по (pub_date, id) без пропусков."""
+        expected = list(
+            Post.objects.order_by('-pub_date', '-id').values_list(
+                'id', flat=True
+            )
+        )
+        ids = []
+        url = '/api/v1/posts/?limit=4'
+        while url:
+            # Только сама страница: ETag берется из кеша.
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+            ids.extend(post['id'] for post in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(ids, expected)
+        previous = self.client.get(response.data['previous'])
+        self.assertEqual(
+            [post['id'] for post in previous.data['results']],
+            expected[8:12]
+        )
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/v1/posts/?cursor=broken')
+        self.assertEqual(response.status_code, 404)
+
+    def test_offset_fallback(self):
+        """Старые клиенты с ?offset= получают пагинацию limit/offset."""
+        response = self.client.get('/api/v1/posts/?limit=5&offset=10')
+        self.assertEqual(response.data['count'], 15)
+        self.assertEqual(len(response.data['results']), 5)
+
+    def test_query_budget(self):
+        for limit in (10, 100):
+            with self.subTest(limit=limit):
+                cache.clear()
+                response = assert_query_budget(
+                    self.client, 'posts-list', data={'limit': limit}
+                )
+                self.assertEqual(len(response.data['results']), min(limit, 15))
+
+    def test_fast_list_serializer(self):
+        """Быстрая сериализация списка совпадает с обычной DRF."""
+        posts = list(Post.objects.select_related('author'))
+        context = {'cache_representation': False}
+        self.assertEqual(
+            PostSerializer(posts, many=True, context=context).data,
+            serializers.ListSerializer(
+                posts, child=PostSerializer(), context=context
+            ).data
+        )
+
+
+class SparseFieldsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        for i in range(3):
+            post = Post.objects.create(
+                author=cls.user, text=f'Пост {i}', group=cls.group
+            )
+            Comment.objects.create(post=post, author=cls.user, text='Ок')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_fields(self):
+        """?fields= оставляет только перечисленные поля."""
+        response = self.client.get('/api/v1/posts/?fields=id,text')
+        for post in response.data['results']:
+            self.assertEqual(set(post), {'id', 'text'})
+
+    def test_include(self):
+        """?include= вкладывает группу и комментарии без запроса на пост."""
+        # Страница, группы и комментарии; ETag берется из кеша.
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                '/api/v1/posts/?fields=id&include=group,comments'
+            )
+        post = response.data['results'][0]
+        self.assertEqual(set(post), {'id', 'group', 'comments'})
+        self.assertEqual(post['group']['slug'], self.group.slug)
+        self.assertEqual(post['comments'][0]['author'], self.user.username)
+
+    def test_include_ignored_on_write(self):
+        """На запись вложенные поля не подставляются."""
+        response = self.client.post(
+            '/api/v1/posts/?include=group',
+            {'text': 'Новый пост', 'group': self.group.id}
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['group'], self.group.id)
+
+
+class RepresentationCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(author=cls.user, text='Текст')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_cached_representation(self):
+        """Повторный ответ собирается из кэша, сохранение дает новый."""
+        url = f'/api/v1/posts/{self.post.id}/'
+        self.client.get(url)
+        with mock.patch(
+            'api.serializers.FastListSerializer.serialize',
+            side_effect=AssertionError
+        ), mock.patch(
+            'rest_framework.serializers.ModelSerializer.to_representation',
+            side_effect=AssertionError
+        ):
+            self.assertEqual(self.client.get(url).data['text'], 'Текст')
+            self.assertEqual(
+                self.client.get('/api/v1/posts/').data['results'][0]['text'],
+                'Текст'
+            )
+        self.post.text = 'Новый текст'
+        self.post.save()
+        self.assertEqual(self.client.get(url).data['text'], 'Новый текст')
+        self.user.username = 'renamed'
+        self.user.save()
+        self.assertEqual(self.client.get(url).data['author'], 'renamed')
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(author=cls.user, text='Текст')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_not_modified(self):
+        """Неизменный список отвечает 304 без запросов к базе, новый
+        комментарий меняет ETag."""
+        urls = (
+            '/api/v1/posts/',
+            f'/api/v1/posts/{self.post.id}/',
+            f'/api/v1/posts/{self.post.id}/comments/',
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                with self.assertNumQueries(0):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+        etags = {url: self.client.get(url)['ETag'] for url in urls}
+        Comment.objects.create(post=self.post, author=self.user, text='Ок')
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etags[url])
+                self.assertEqual(response.status_code, 200)
+
+
+class BulkCreateTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author')
+        cls.follower = User.objects.create_user(username='follower')
+        Follow.objects.create(user=cls.follower, author=cls.user)
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        cls.post = Post.objects.create(author=cls.user, text='Текст')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_bulk_create_posts(self):
+        """Список постов создается целиком вместе с лентами, счетчиками
+        и поисковым индексом."""
+        payload = [
+            {'text': 'Первый массовый', 'group': self.group.id},
+            {'text': 'Второй массовый'},
+        ]
+        response = self.client.post('/api/v1/posts/', payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data), 2)
+        for item, data in zip(response.data, payload):
+            post = Post.objects.get(pk=item['id'])
+            self.assertEqual(post.text, data['text'])
+            self.assertEqual(post.author, self.user)
+        self.assertEqual(response.data[0]['group'], self.group.id)
+        created_ids = {item['id'] for item in response.data}
+        self.assertTrue(created_ids <= set(
+            TimelineEntry.objects.filter(
+                user=self.follower
+            ).values_list('post_id', flat=True)
+        ))
+        self.user.refresh_from_db()
+        self.assertEqual(user_stats(self.user).posts_count, 3)
+        self.assertEqual(
+            {post.id for post in search_posts('массовый')}, created_ids
+        )
+
+    def test_bulk_errors_per_item(self):
+        """Ошибка в одном элементе отменяет весь список."""
+        payload = [{'text': 'Верный'}, {'group': self.group.id}]
+        response = self.client.post('/api/v1/posts/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('text', response.data[1])
+        self.assertEqual(Post.objects.count(), 1)
+
+    def test_bulk_size_limit(self):
+        payload = [{'text': str(i)} for i in range(101)]
+        response = self.client.post('/api/v1/posts/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Post.objects.count(), 1)
+
+    def test_bulk_create_comments(self):
+        url = f'/api/v1/posts/{self.post.id}/comments/'
+        payload = [
+            {'text': 'Раз', 'post': self.post.id},
+            {'text': 'Два', 'post': self.post.id},
+        ]
+        response = self.client.post(url, payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            [item['text'] for item in response.data], ['Раз', 'Два']
+        )
+        self.assertEqual(
+            set(self.post.comments.values_list('id', flat=True)),
+            {item['id'] for item in response.data}
+        )
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 2)
+
+
+class ExportTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author')
+        cls.posts = [
+            Post.objects.create(author=cls.user, text=f'Пост {i}')
+            for i in range(3)
+        ]
+        Comment.objects.create(
+            post=cls.posts[0], author=cls.user, text='Комментарий'
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def export(self, query=''):
+        response = self.client.get(f'/api/v1/export/{query}')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return [
+            json.loads(line)
+            for line in b''.join(response.streaming_content).splitlines()
+        ]
+
+    def test_export_chunks_and_resume(self):
+        """Пачки разделены курсорами, с курсора выгрузка продолжается."""
+        records = self.export('?chunk_size=2&include=comments')
+        self.assertEqual(
+            [record['type'] for record in records],
+            ['post', 'comment', 'post', 'cursor', 'post', 'cursor']
+        )
+        self.assertEqual(records[0]['data']['id'], self.posts[0].id)
+        self.assertEqual(records[1]['data']['text'], 'Комментарий')
+        cursor = records[3]['cursor']
+        resumed = self.export(f'?cursor={cursor}')
+        self.assertEqual(
+            [record['data']['id'] for record in resumed[:-1]],
+            [self.posts[2].id]
+        )
+
+    def test_export_errors(self):
+        response = self.client.get('/api/v1/export/?cursor=abc')
+        self.assertEqual(response.status_code, 400)
+        self.client.force_authenticate(None)
+        response = self.client.get('/api/v1/export/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_export_command(self):
+        out = StringIO()
+        call_command('export_ndjson', '--chunk-size=2', stdout=out,
+                     stderr=StringIO())
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(
+            [record['data']['id'] for record in records
+             if record['type'] == 'post'],
+            [post.id for post in self.posts]
+        )
+
+    def test_export_command_resume(self):
+        """Продолжение с курсора заменяет оборванную пачку в файле."""
+        with tempfile.TemporaryDirectory() as directory:
+            full = os.path.join(directory, 'full.ndjson')
+            call_command('export_ndjson', '--chunk-size=2', output=full,
+                         stderr=StringIO())
+            with open(full, encoding='utf-8') as stream:
+                lines = stream.readlines()
+            # Выгрузку убили посреди второй пачки.
+            path = os.path.join(directory, 'posts.ndjson')
+            with open(path, 'w', encoding='utf-8') as stream:
+                stream.writelines(lines[:4])
+                stream.write(lines[4][:10])
+            cursor = json.loads(lines[2])['cursor']
+            call_command('export_ndjson', '--chunk-size=2', output=path,
+                         cursor=cursor, stderr=StringIO())
+            with open(path, encoding='utf-8') as stream:
+                self.assertEqual(stream.readlines(), lines)
+            with self.assertRaises(CommandError):
+                call_command('export_ndjson', output=path, cursor='1000',
+                             stderr=StringIO())
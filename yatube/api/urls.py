@@ -1,7 +1,9 @@
+from core.querybudget import register_budgets
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import CommentViewSet, FollowViewSet, GroupViewSet, PostViewSet
+from .views import (CommentViewSet, ExportView, FollowViewSet, GroupViewSet,
+                    PostViewSet)
 
 router = DefaultRouter()
 
@@ -13,7 +15,22 @@ router.register(
     CommentViewSet, basename='comments'
 )
 
+# Бюджеты SQL-запросов (core.querybudget) не зависят от ?limit=.
+QUERY_BUDGETS = {
+    'api-root': 1,
+    'posts-list': 3,
+    'posts-detail': 3,
+    'comments-list': 4,
+    'comments-detail': 4,
+    'groups-list': 2,
+    'groups-detail': 2,
+    'follow-list': 3,
+    'follow-detail': 3,
+}
+register_budgets(QUERY_BUDGETS)
+
 urlpatterns = [
     path('v1/', include('djoser.urls.jwt')),
+    path('v1/export/', ExportView.as_view(), name='export'),
     path('v1/', include(router.urls)),
 ]
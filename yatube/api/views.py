@@ -1,26 +1,189 @@
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from posts.conditional import generation_state, state_etag
 from posts.models import Comment, Follow, Group, Post
+from posts.search import search_posts
+from posts.uploads import use_image_handler
 from rest_framework import viewsets, filters
+from rest_framework.exceptions import ValidationError
 from rest_framework.generics import get_object_or_404
 from rest_framework.pagination import LimitOffsetPagination
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
+from rest_framework.views import APIView
 from django_filters.rest_framework import DjangoFilterBackend
 
+from .export import (EXPORT_CHUNK_SIZE, MAX_EXPORT_CHUNK_SIZE,
+                     export_lines, parse_cursor)
+from .pagination import KeysetCursorPagination
 from .permissions import IsAuthorOrReadOnly, ReadOnly
 from .serializers import (CommentSerializer, FollowSerializer, GroupSerializer,
                           PostSerializer)
 
 
-class PostViewSet(viewsets.ModelViewSet):
-    queryset = Post.objects.all()
+def split_param(value):
+    return [name.strip() for name in (value or '').split(',') if name.strip()]
+
+
+class SparseFieldsViewMixin:
+    """Передает сериализатору ?fields= и ?include= на чтение и
+    подгружает вложенные связи через prefetch_related."""
+
+    def get_include_lookups(self):
+        return {}
+
+    @property
+    def included(self):
+        if self.request.method not in SAFE_METHODS:
+            return []
+        lookups = self.get_include_lookups()
+        return [
+            name for name in split_param(
+                self.request.query_params.get('include')
+            )
+            if name in lookups
+        ]
+
+    def get_serializer(self, *args, **kwargs):
+        if self.request.method in SAFE_METHODS:
+            kwargs.setdefault('fields', split_param(
+                self.request.query_params.get('fields')
+            ))
+            kwargs.setdefault('include', self.included)
+        return super().get_serializer(*args, **kwargs)
+
+    def prefetch_included(self, queryset):
+        include_lookups = self.get_include_lookups()
+        lookups = [include_lookups[name] for name in self.included]
+        return queryset.prefetch_related(*lookups) if lookups else queryset
+
+
+class ConditionalViewMixin:
+    """ETag и Last-Modified для list и retrieve.
+
+    Состояние (posts.conditional) проверяется до выборки и сериализации,
+    при совпадении ETag ответом будет 304.
+    """
+
+    def get_list_state(self):
+        return generation_state()
+
+    def get_object_state(self):
+        return generation_state()
+
+    def conditional_response(self, state, respond):
+        if state is None:
+            return respond()
+        etag = quote_etag(state_etag(state))
+        last_modified = state['last_modified']
+        if last_modified is not None:
+            last_modified = int(last_modified.timestamp())
+        response = get_conditional_response(
+            self.request, etag=etag, last_modified=last_modified
+        )
+        if response is not None:
+            return response
+        response = respond()
+        if response.status_code == 200:
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            self.get_list_state(),
+            lambda: super(ConditionalViewMixin, self).list(
+                request, *args, **kwargs
+            )
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            self.get_object_state(),
+            lambda: super(ConditionalViewMixin, self).retrieve(
+                request, *args, **kwargs
+            )
+        )
+
+
+class BulkCreateViewMixin:
+    """POST со списком объектов создает их все в одной транзакции.
+
+    Список проверяется целиком: если хоть один элемент неверен, ничего
+    не создается, а ответ 400 содержит ошибки по позициям списка
+    ({} у верных элементов).
+    """
+    max_bulk_size = 100
+
+    def get_serializer(self, *args, **kwargs):
+        if isinstance(kwargs.get('data'), list):
+            kwargs['many'] = True
+        return super().get_serializer(*args, **kwargs)
+
+    def create(self, request, *args, **kwargs):
+        if (isinstance(request.data, list)
+                and len(request.data) > self.max_bulk_size):
+            raise ValidationError({'non_field_errors': [
+                f'Не больше {self.max_bulk_size} объектов за запрос.'
+            ]})
+        return super().create(request, *args, **kwargs)
+
+
+class PostViewSet(BulkCreateViewMixin, ConditionalViewMixin,
+                  SparseFieldsViewMixin, viewsets.ModelViewSet):
+    queryset = Post.objects.select_related('author')
     serializer_class = PostSerializer
     permission_classes = [IsAuthorOrReadOnly, ]
-    pagination_class = LimitOffsetPagination
+    pagination_class = KeysetCursorPagination
+
+    def get_pagination_class(self):
+        # Результаты поиска упорядочены по релевантности, а не по ключу
+        # (pub_date, id); ?offset= оставлен для старых клиентов.
+        params = self.request.query_params
+        if params.get('search') or 'offset' in params:
+            return LimitOffsetPagination
+        return self.pagination_class
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            self._paginator = self.get_pagination_class()()
+        return self._paginator
+
+    def initialize_request(self, request, *args, **kwargs):
+        # До аутентификации: проверка CSRF сессии читает тело запроса.
+        use_image_handler(request)
+        return super().initialize_request(request, *args, **kwargs)
+
+    def get_include_lookups(self):
+        return {
+            'group': 'group',
+            'comments': Prefetch(
+                'comments',
+                queryset=Comment.objects.select_related('author')
+            ),
+        }
+
+    def get_queryset(self):
+        query = self.request.query_params.get('search')
+        if self.action == 'list' and query:
+            return self.prefetch_included(search_posts(query))
+        return self.prefetch_included(super().get_queryset())
+
+    def get_list_state(self):
+        # Результаты поиска зависят от ранжирования FTS5, не от записей.
+        if self.request.query_params.get('search'):
+            return None
+        return super().get_list_state()
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
 
-class CommentViewSet(viewsets.ModelViewSet):
+class CommentViewSet(BulkCreateViewMixin, ConditionalViewMixin,
+                     SparseFieldsViewMixin, viewsets.ModelViewSet):
     queryset = Comment.objects.all()
     serializer_class = CommentSerializer
     permission_classes = [IsAuthorOrReadOnly, ]
@@ -31,7 +194,7 @@ class CommentViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         post = get_object_or_404(Post, pk=self.kwargs.get("post_id"))
-        queryset = post.comments.all()
+        queryset = post.comments.select_related('author')
         return queryset
 
 
@@ -52,3 +215,36 @@ class FollowViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         return Follow.objects.filter(user=self.request.user)
+
+
+class ExportView(APIView):
+    """Потоковая выгрузка всех постов в NDJSON (см. api.export).
+
+    ?cursor= продолжает прерванную выгрузку, ?chunk_size= задает размер
+    пачки, ?include=comments добавляет комментарии.
+    """
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request):
+        last_pk = parse_cursor(request.query_params.get('cursor'))
+        if last_pk is None:
+            raise ValidationError({'cursor': ['Неверный курсор.']})
+        try:
+            chunk_size = int(
+                request.query_params.get('chunk_size', EXPORT_CHUNK_SIZE)
+            )
+        except ValueError:
+            chunk_size = EXPORT_CHUNK_SIZE
+        if chunk_size <= 0:
+            chunk_size = EXPORT_CHUNK_SIZE
+        lines = export_lines(
+            last_pk,
+            chunk_size=min(chunk_size, MAX_EXPORT_CHUNK_SIZE),
+            comments='comments' in split_param(
+                request.query_params.get('include')
+            ),
+            request=request,
+        )
+        return StreamingHttpResponse(
+            lines, content_type='application/x-ndjson; charset=utf-8'
+        )
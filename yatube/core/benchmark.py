@@ -0,0 +1,180 @@
+"""Замер именованных URL приложения тестовым клиентом Django.
+
+Запрос проходит весь стек middleware, шаблонов и базы, как в работе,
+но без сети и сервера. Параметры URL подставляются из данных базы:
+самая большая группа, самый плодовитый автор, самый обсуждаемый пост.
+"""
+import time
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+from posts.models import Comment, Follow, Group, Post
+from rest_framework.authtoken.models import Token
+
+User = get_user_model()
+
+BENCHMARK_URLCONFS = ('posts.urls', 'api.urls')
+# GET на эти адреса меняет данные или только перенаправляет.
+SKIP_URL_NAMES = {
+    'posts:add_comment',
+    'posts:profile_follow',
+    'posts:profile_unfollow',
+}
+# Адрес не из INTERNAL_IPS: debug_toolbar не встраивается в ответы.
+CLIENT_ADDRESS = '192.0.2.1'
+
+
+def percentile(timings, share):
+    """Перцентиль по ближайшему рангу; timings отсортированы."""
+    index = min(len(timings) - 1, int(len(timings) * share))
+    return timings[index]
+
+
+def named_patterns(resolver=None, namespace='', origin=None):
+    """Пары (полное имя, имена параметров) именованных URL и модуль
+    urls, из которого они подключены."""
+    resolver = resolver or get_resolver()
+    for pattern in resolver.url_patterns:
+        if isinstance(pattern, URLResolver):
+            urlconf = pattern.urlconf_name
+            name = getattr(urlconf, '__name__', urlconf)
+            yield from named_patterns(
+                pattern,
+                f'{namespace}{pattern.namespace}:'
+                if pattern.namespace else namespace,
+                name if isinstance(name, str) else origin,
+            )
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            params = set(pattern.pattern.regex.groupindex)
+            yield origin, f'{namespace}{pattern.name}', params
+
+
+def benchmark_urls(urlconfs=BENCHMARK_URLCONFS):
+    """Имена и параметры URL из модулей urlconfs, без повторов."""
+    seen = {}
+    for origin, name, params in named_patterns():
+        # Суффиксы формата DRF дублируют те же имена.
+        if (origin not in urlconfs or name in SKIP_URL_NAMES
+                or 'format' in params or name in seen):
+            continue
+        seen[name] = params
+    return seen
+
+
+class SampleObjects:
+    """Объекты, на которых замеряются страницы с параметрами."""
+
+    def __init__(self, user=None):
+        self.author = User.objects.annotate(
+            total=Count('posts')
+        ).order_by('-total').first()
+        self.user = user or User.objects.annotate(
+            total=Count('follower')
+        ).order_by('-total').first()
+        self.group = Group.objects.annotate(
+            total=Count('posts')
+        ).order_by('-total').first()
+        self.post = Post.objects.order_by('-comment_count', '-pk').first()
+        self.comment = self.post and self.post.comments.order_by('pk').last()
+        self.follow = self.user and Follow.objects.filter(
+            user=self.user
+        ).first()
+
+    def kwargs(self, name, params):
+        """Параметры URL name или None, если подставить нечего."""
+        # В API pk относится к объекту из имени маршрута: posts-detail.
+        pk_objects = {
+            'posts': self.post,
+            'comments': self.comment,
+            'groups': self.group,
+            'follow': self.follow,
+        }
+        values = {
+            'slug': self.group and self.group.slug,
+            'username': self.author and self.author.username,
+            'post_id': self.post and self.post.pk,
+            'pk': getattr(pk_objects.get(name.split('-')[0]), 'pk', None),
+        }
+        kwargs = {param: values.get(param) for param in params}
+        if any(value is None for value in kwargs.values()):
+            return None
+        return kwargs
+
+
+def client_for(user):
+    client = Client(REMOTE_ADDR=CLIENT_ADDRESS)
+    if user is not None:
+        client.force_login(user)
+        token, _ = Token.objects.get_or_create(user=user)
+        client.defaults['HTTP_AUTHORIZATION'] = f'Token {token.key}'
+    return client
+
+
+def measure(client, path, iterations, warmup=2):
+    """Время ответов в мс (отсортированное), число запросов к базе и
+    код ответа.
+
+    Тестовый клиент пробрасывает исключения view; они не прерывают
+    замер остальных URL, а попадают в результат.
+    """
+    for _ in range(warmup):
+        client.get(path)
+    timings = []
+    queries = 0
+    status = None
+    for _ in range(iterations):
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            response = client.get(path)
+            timings.append((time.perf_counter() - start) * 1e3)
+        queries = max(queries, len(context))
+        status = response.status_code
+    timings.sort()
+    return timings, queries, status
+
+
+def dataset_size():
+    return {
+        'users': User.objects.count(),
+        'groups': Group.objects.count(),
+        'posts': Post.objects.count(),
+        'comments': Comment.objects.count(),
+        'follows': Follow.objects.count(),
+    }
+
+
+def run(iterations=20, warmup=2, user=None, names=None):
+    """Замеры всех URL: {имя: {path, status, p50_ms, p95_ms, p99_ms,
+    queries}}."""
+    samples = SampleObjects(user)
+    client = client_for(samples.user)
+    results = {}
+    for name, params in benchmark_urls().items():
+        if names and name not in names:
+            continue
+        kwargs = samples.kwargs(name, params)
+        if kwargs is None:
+            continue
+        path = reverse(name, kwargs=kwargs)
+        try:
+            timings, queries, status = measure(
+                client, path, iterations, warmup
+            )
+        except Exception as error:
+            results[name] = {'path': path, 'error': repr(error)}
+            continue
+        if status == 405:
+            continue
+        results[name] = {
+            'path': path,
+            'status': status,
+            'p50_ms': round(percentile(timings, 0.5), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+            'p99_ms': round(percentile(timings, 0.99), 2),
+            'queries': queries,
+        }
+    return results
@@ -0,0 +1,239 @@
+"""Кэш в файле SQLite (WAL), общий для всех процессов на одном хосте.
+
+Замена LocMemCache: каждый WSGI-воркер видит те же записи, а сброс
+кэша из одного процесса сразу виден остальным. Записи хранят срок жизни
+и время последнего обращения, при переполнении вытесняются давно не
+читавшиеся (LRU).
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache.SQLiteCache',
+            'LOCATION': '/var/tmp/yatube-cache.sqlite3',
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        }
+    }
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from . import metrics
+
+# Время обращения обновляется не чаще раза в LRU_RESOLUTION секунд, чтобы
+# чтение не превращалось в запись при каждом попадании.
+LRU_RESOLUTION = 60
+# Переполнение проверяется раз в CULL_EVERY записей процесса, а не при
+# каждой: COUNT(*) по всей таблице не бесплатен.
+CULL_EVERY = 50
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    ' key TEXT PRIMARY KEY,'
+    ' value BLOB NOT NULL,'
+    ' expires REAL,'
+    ' accessed REAL NOT NULL'
+    ') WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+    'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)',
+)
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.location = location
+        self._local = threading.local()
+        self._writes = 0
+
+    @property
+    def _connection(self):
+        # Соединение свое у каждого потока и каждого процесса после fork.
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(
+                self.location, timeout=5, isolation_level=None,
+                check_same_thread=False
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA:
+                connection.execute(statement)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _write(self):
+        """Транзакция записи, сразу захватывающая блокировку файла."""
+        return _WriteTransaction(self._connection)
+
+    def _key(self, key, version):
+        # validate_key() не вызываем: он проверяет ограничения memcached
+        # посимвольно, а SQLite принимает любые ключи. На get_many из сотни
+        # ключей проверка стоила больше самого запроса.
+        return self.make_key(key, version=version)
+
+    def _fetch(self, keys):
+        """Непросроченные значения {key: value}, отмечает обращение к ним."""
+        if not keys:
+            return {}
+        placeholders = ', '.join('?' * len(keys))
+        rows = self._connection.execute(
+            f'SELECT key, value, accessed FROM cache '
+            f'WHERE key IN ({placeholders}) '
+            f'AND (expires IS NULL OR expires > ?)',
+            (*keys, time.time())
+        ).fetchall()
+        now = time.time()
+        stale = [key for key, _, accessed in rows
+                 if now - accessed > LRU_RESOLUTION]
+        if stale:
+            with self._write() as connection:
+                connection.executemany(
+                    'UPDATE cache SET accessed = ? WHERE key = ?',
+                    [(now, key) for key in stale]
+                )
+        return {key: pickle.loads(value) for key, value, _ in rows}
+
+    def get(self, key, default=None, version=None):
+        raw_key = self._key(key, version)
+        found = self._fetch([raw_key])
+        metrics.record_cache([key], {key} if raw_key in found else ())
+        return found.get(raw_key, default)
+
+    def get_many(self, keys, version=None):
+        keys_map = {self._key(key, version): key for key in keys}
+        found = {
+            keys_map[key]: value
+            for key, value in self._fetch(list(keys_map)).items()
+        }
+        metrics.record_cache(keys_map.values(), found)
+        return found
+
+    def _store(self, connection, mode, key, value, timeout):
+        expires = self.get_backend_timeout(timeout)
+        cursor = connection.execute(
+            f'INSERT OR {mode} INTO cache (key, value, expires, accessed) '
+            f'VALUES (?, ?, ?, ?)',
+            (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+             expires, time.time())
+        )
+        return cursor.rowcount > 0
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        with self._write() as connection:
+            self._store(connection, 'REPLACE', key, value, timeout)
+            self._cull(connection)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        with self._write() as connection:
+            for key, value in data.items():
+                self._store(
+                    connection, 'REPLACE', self._key(key, version),
+                    value, timeout
+                )
+            self._cull(connection)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        with self._write() as connection:
+            connection.execute(
+                'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                (key, time.time())
+            )
+            added = self._store(connection, 'IGNORE', key, value, timeout)
+            if added:
+                self._cull(connection)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        with self._write() as connection:
+            cursor = connection.execute(
+                'UPDATE cache SET expires = ?, accessed = ? '
+                'WHERE key = ? AND (expires IS NULL OR expires > ?)',
+                (self.get_backend_timeout(timeout), time.time(),
+                 key, time.time())
+            )
+        return cursor.rowcount > 0
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        with self._write() as connection:
+            row = connection.execute(
+                'SELECT value FROM cache '
+                'WHERE key = ? AND (expires IS NULL OR expires > ?)',
+                (key, time.time())
+            ).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            connection.execute(
+                'UPDATE cache SET value = ?, accessed = ? WHERE key = ?',
+                (pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                 time.time(), key)
+            )
+        return value
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        return key in self._fetch([key])
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version=version)
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        if not keys:
+            return
+        with self._write() as connection:
+            connection.executemany(
+                'DELETE FROM cache WHERE key = ?', [(key,) for key in keys]
+            )
+
+    def clear(self):
+        with self._write() as connection:
+            connection.execute('DELETE FROM cache')
+
+    def _cull(self, connection):
+        self._writes += 1
+        if self._writes % CULL_EVERY:
+            return
+        connection.execute(
+            'DELETE FROM cache WHERE expires <= ?', (time.time(),)
+        )
+        if self._max_entries <= 0:
+            return
+        count = connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count <= self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            connection.execute('DELETE FROM cache')
+            return
+        connection.execute(
+            'DELETE FROM cache WHERE key IN ('
+            ' SELECT key FROM cache ORDER BY accessed LIMIT ?'
+            ')',
+            (count // self._cull_frequency,)
+        )
+
+    def close(self, **kwargs):
+        # Соединения живут весь срок процесса, как и у LocMemCache.
+        pass
+
+
+class _WriteTransaction:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute('BEGIN IMMEDIATE')
+        return self.connection
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.connection.execute('COMMIT' if exc_type is None else 'ROLLBACK')
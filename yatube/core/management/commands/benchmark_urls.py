@@ -0,0 +1,156 @@
+import json
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core import benchmark
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет все именованные URL из posts.urls и api.urls на текущих '
+        'данных (см. generate_data): p50/p95/p99 времени ответа и число '
+        'SQL-запросов. Результат пишется в JSON и сравнивается с '
+        'предыдущим замером.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations', type=int, default=20,
+            help='Сколько раз запросить каждый URL.'
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=2,
+            help='Сколько запросов сделать до замера (кэши, соединения).'
+        )
+        parser.add_argument(
+            '--user',
+            help='От чьего имени запрашивать, по умолчанию — у кого '
+                 'больше всего подписок.'
+        )
+        parser.add_argument(
+            '--url', action='append', dest='names',
+            help='Замерить только этот URL, например posts:index.'
+        )
+        parser.add_argument(
+            '--output', '-o',
+            help='Записать результат в JSON-файл.'
+        )
+        parser.add_argument(
+            '--compare',
+            help='JSON прошлого замера: показать изменения.'
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=0.2,
+            help='Допустимый рост p95, доля (0.2 — на 20%%).'
+        )
+        parser.add_argument(
+            '--min-delta-ms', type=float, default=1.0,
+            help='Рост p95 меньше этого в мс считается шумом.'
+        )
+
+    def handle(self, *args, iterations, warmup, user, names, output,
+               compare, tolerance, min_delta_ms, **options):
+        if iterations <= 0:
+            raise CommandError('--iterations должен быть больше нуля')
+        if user is not None:
+            try:
+                user = User.objects.get(username=user)
+            except User.DoesNotExist:
+                raise CommandError(f'Нет пользователя {user}')
+        baseline = None
+        if compare:
+            with open(compare, encoding='utf-8') as stream:
+                baseline = json.load(stream)
+        results = benchmark.run(iterations, warmup, user, names)
+        report = {
+            'created': timezone.now().isoformat(),
+            'django': django.get_version(),
+            'iterations': iterations,
+            'dataset': benchmark.dataset_size(),
+            'urls': results,
+        }
+        self.print_results(results)
+        if output:
+            with open(output, 'w', encoding='utf-8') as stream:
+                json.dump(report, stream, ensure_ascii=False, indent=2)
+        if baseline is not None:
+            regressions = self.compare(
+                baseline, report, tolerance, min_delta_ms, names
+            )
+            if regressions:
+                raise CommandError(
+                    f'Ухудшились: {", ".join(regressions)}'
+                )
+
+    def print_results(self, results):
+        for name, result in results.items():
+            if 'error' in result:
+                self.stderr.write(f'{name:<28} ошибка: {result["error"]}')
+                continue
+            self.stdout.write(
+                f'{name:<28} {result["status"]} '
+                f'p50 {result["p50_ms"]:8.2f} мс  '
+                f'p95 {result["p95_ms"]:8.2f} мс  '
+                f'p99 {result["p99_ms"]:8.2f} мс  '
+                f'запросов {result["queries"]}'
+            )
+
+    def compare(self, baseline, report, tolerance, min_delta_ms,
+                names=None):
+        """Печатает изменения относительно baseline, возвращает имена
+        URL, где p95 вырос больше tolerance (и больше min_delta_ms),
+        прибавились запросы, появилась ошибка или которых нет в замере."""
+        if baseline.get('dataset') != report['dataset']:
+            self.stderr.write(
+                'Данные отличаются от прошлого замера: '
+                f'{baseline.get("dataset")} против {report["dataset"]}'
+            )
+        before_urls = baseline.get('urls', {})
+        regressions = [
+            name for name in before_urls
+            if name not in report['urls'] and (not names or name in names)
+        ]
+        for name in regressions:
+            self.stdout.write(f'{name:<28} нет в замере  УХУДШЕНИЕ')
+        for name, result in report['urls'].items():
+            line, worse = self.compare_url(
+                before_urls.get(name), result, tolerance, min_delta_ms
+            )
+            if line is None:
+                continue
+            self.stdout.write(
+                f'{name:<28} {line}' + ('  УХУДШЕНИЕ' if worse else '')
+            )
+            if worse:
+                regressions.append(name)
+        return regressions
+
+    def compare_url(self, before, result, tolerance, min_delta_ms):
+        """Строка сравнения одного URL и признак ухудшения; (None, False),
+        если сравнивать не с чем."""
+        if 'error' in result:
+            # Ухудшение, если в прошлом замере URL отвечал без ошибки.
+            return (
+                f'ошибка: {result["error"]}',
+                before is None or 'error' not in before,
+            )
+        if before is None or 'error' in before:
+            return None, False
+        change = (
+            result['p95_ms'] / before['p95_ms'] - 1
+            if before['p95_ms'] else 0
+        )
+        queries = result['queries'] - before['queries']
+        slower = (
+            change > tolerance
+            and result['p95_ms'] - before['p95_ms'] > min_delta_ms
+        )
+        return (
+            f'p95 {change:+.0%}  запросов {queries:+d}',
+            slower or queries > 0,
+        )
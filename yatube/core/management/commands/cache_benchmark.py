@@ -0,0 +1,60 @@
+import os
+import statistics
+import tempfile
+import time
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from core.cache import SQLiteCache
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает задержку попадания в кэш для SQLiteCache и LocMemCache '
+        'на типичном значении — HTML-карточке поста.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--iterations', type=int, default=10000,
+            help='Сколько чтений выполнить для каждого бэкенда.'
+        )
+        parser.add_argument(
+            '--size', type=int, default=2048,
+            help='Размер значения в байтах.'
+        )
+        parser.add_argument(
+            '--keys', type=int, default=1000,
+            help='Сколько разных ключей читать по кругу.'
+        )
+
+    def handle(self, *args, iterations, size, keys, **options):
+        value = 'x' * size
+        with tempfile.TemporaryDirectory() as directory:
+            backends = {
+                'locmem': LocMemCache('benchmark', {
+                    'OPTIONS': {'MAX_ENTRIES': keys * 2},
+                }),
+                'sqlite': SQLiteCache(
+                    os.path.join(directory, 'cache.sqlite3'),
+                    {'OPTIONS': {'MAX_ENTRIES': keys * 2}},
+                ),
+            }
+            for name, backend in backends.items():
+                backend.set_many(
+                    {f'card:{i}': value for i in range(keys)}, None
+                )
+                timings = []
+                for i in range(iterations):
+                    key = f'card:{i % keys}'
+                    start = time.perf_counter()
+                    backend.get(key)
+                    timings.append((time.perf_counter() - start) * 1e6)
+                timings.sort()
+                self.stdout.write(
+                    f'{name:>6}: '
+                    f'p50 {statistics.median(timings):.1f} мкс, '
+                    f'p99 {timings[int(len(timings) * 0.99)]:.1f} мкс, '
+                    f'среднее {statistics.mean(timings):.1f} мкс'
+                )
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core.profiling import make_token
+
+
+class Command(BaseCommand):
+    help = (
+        'Выдает подписанный токен для заголовка X-Profile: запросы с ним '
+        'профилируются (см. core.profiling). Токен действует '
+        'PROFILE_TOKEN_MAX_AGE секунд.'
+    )
+
+    def handle(self, *args, **options):
+        self.stdout.write(make_token())
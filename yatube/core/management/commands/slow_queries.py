@@ -0,0 +1,78 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.slowqueries import normalize, read
+
+SORT_KEYS = {
+    'total': lambda shape: shape['total_ms'],
+    'count': lambda shape: shape['count'],
+    'max': lambda shape: shape['worst']['ms'],
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Сводка журнала медленных запросов (SLOW_QUERY_LOG) по форме '
+        'запроса: сколько раз, суммарное и худшее время, из каких view, '
+        'план и стек худшего случая.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--log', default=None,
+            help='Файл журнала, по умолчанию SLOW_QUERY_LOG.'
+        )
+        parser.add_argument(
+            '--limit', type=int, default=10,
+            help='Сколько форм запросов показать.'
+        )
+        parser.add_argument(
+            '--sort', choices=sorted(SORT_KEYS), default='total',
+            help='Порядок: суммарное время, число или худшее время.'
+        )
+
+    def handle(self, *args, log, limit, sort, **options):
+        shapes = self.summarize(read(log or settings.SLOW_QUERY_LOG))
+        if not shapes:
+            self.stdout.write('Медленных запросов нет.')
+            return
+        worst = sorted(shapes.values(), key=SORT_KEYS[sort], reverse=True)
+        for number, shape in enumerate(worst[:limit], 1):
+            self.print_shape(number, shape)
+
+    def summarize(self, records):
+        """{форма: count, total_ms, views, worst} по записям журнала."""
+        shapes = {}
+        for record in records:
+            key = normalize(record['sql'])
+            shape = shapes.setdefault(key, {
+                'shape': key, 'count': 0, 'total_ms': 0.0, 'views': set(),
+                'worst': record,
+            })
+            shape['count'] += 1
+            shape['total_ms'] += record['ms']
+            shape['views'].add(record['view'] or '-')
+            if record['ms'] > shape['worst']['ms']:
+                shape['worst'] = record
+        return shapes
+
+    def print_shape(self, number, shape):
+        worst = shape['worst']
+        plan = worst.get('plan') or []
+        scans = [line.strip() for line in plan
+                 if line.strip().startswith('SCAN')]
+        self.stdout.write(
+            f'{number}. {shape["count"]} раз, всего '
+            f'{shape["total_ms"]:.1f} мс, среднее '
+            f'{shape["total_ms"] / shape["count"]:.1f} мс, худшее '
+            f'{worst["ms"]:.1f} мс'
+            + ('  ПОЛНЫЙ ПРОСМОТР' if scans else '')
+        )
+        self.stdout.write(f'   view: {", ".join(sorted(shape["views"]))}')
+        self.stdout.write(f'   {shape["shape"]}')
+        self.stdout.write(f'   худший: {worst["method"]} {worst["path"]}')
+        for line in plan:
+            self.stdout.write(f'     план: {line}')
+        for frame in worst.get('stack') or []:
+            self.stdout.write(f'     {frame}')
+        self.stdout.write('')
@@ -0,0 +1,298 @@
+"""Метрики приложения в текстовом формате Prometheus (/metrics/).
+
+Каждый процесс копит приращения в памяти и не чаще раза в
+METRICS_FLUSH_INTERVAL секунд прибавляет их к счетчикам в общем файле
+SQLite METRICS_DATABASE. Поэтому /metrics/ любого воркера отдает сумму по
+всем процессам хоста. Гистограммы хранятся как счетчики по корзинам.
+
+Собираются:
+- число и время HTTP-запросов по имени URL;
+- число и время SQL-запросов;
+- время рендера шаблонов;
+- попадания и промахи кэша по префиксу ключа;
+- время построения миниатюр.
+"""
+import atexit
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.template import base as template_base
+
+from .querybudget import QueryCounter
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, math.inf
+)
+FRAGMENT_CACHE_PREFIX = 'template.cache.'
+
+# Имя -> (тип, описание).
+METRICS = {
+    'yatube_http_requests_total': (
+        'counter', 'HTTP-запросы по имени URL, методу и коду ответа.'
+    ),
+    'yatube_http_request_duration_seconds': (
+        'histogram', 'Время ответа по имени URL.'
+    ),
+    'yatube_db_queries_total': (
+        'counter', 'SQL-запросы по имени URL.'
+    ),
+    'yatube_db_query_seconds_total': (
+        'counter', 'Время SQL-запросов по имени URL.'
+    ),
+    'yatube_template_render_seconds': (
+        'histogram', 'Время рендера шаблона вместе с вложенными.'
+    ),
+    'yatube_cache_requests_total': (
+        'counter', 'Чтения кэша по префиксу ключа: hit или miss.'
+    ),
+    'yatube_thumbnail_generation_seconds': (
+        'histogram', 'Время построения всех миниатюр картинки.'
+    ),
+}
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS metrics ('
+    ' name TEXT NOT NULL,'
+    ' labels TEXT NOT NULL,'
+    ' value REAL NOT NULL,'
+    ' PRIMARY KEY (name, labels)'
+    ') WITHOUT ROWID'
+)
+
+_lock = threading.Lock()
+# (имя ряда, метки) -> приращение с прошлого сброса в файл.
+_pending = {}
+_last_flush = time.monotonic()
+_local = threading.local()
+_templates_instrumented = False
+
+
+def inc(name, value=1, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _pending[key] = _pending.get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    """Наблюдение гистограммы: корзины le сразу накопительные."""
+    labels = tuple(sorted(labels.items()))
+    bucket = f'{name}_bucket'
+    with _lock:
+        for series, delta in ((f'{name}_sum', value), (f'{name}_count', 1)):
+            key = (series, labels)
+            _pending[key] = _pending.get(key, 0) + delta
+        # Пустые корзины тоже пишутся: в выдаче нужен полный набор le.
+        for bound in LATENCY_BUCKETS:
+            key = (bucket, labels + (('le', bound),))
+            _pending[key] = _pending.get(key, 0) + int(value <= bound)
+
+
+def key_prefix(key):
+    """Префикс ключа кэша без идентификаторов и хешей:
+    posts:card:5:ab12 -> posts:card,
+    template.cache.index_page.ab12 -> template.cache.index_page."""
+    if key.startswith(FRAGMENT_CACHE_PREFIX):
+        return '.'.join(key.split('.')[:3])
+    return ':'.join(
+        part for part in key.replace('||', ':').split(':')[:2] if part
+    )
+
+
+def record_cache(keys, found):
+    """Попадания и промахи чтения keys; found — найденные ключи."""
+    for key in keys:
+        inc(
+            'yatube_cache_requests_total', prefix=key_prefix(key),
+            result='hit' if key in found else 'miss'
+        )
+
+
+def _connection():
+    # Соединение свое у потока и процесса, как в core.cache.
+    location = settings.METRICS_DATABASE
+    database = getattr(_local, 'database', None)
+    if database is None or _local.key != (os.getpid(), location):
+        database = sqlite3.connect(
+            location, timeout=5, isolation_level=None,
+            check_same_thread=False
+        )
+        database.execute('PRAGMA journal_mode=WAL')
+        database.execute('PRAGMA synchronous=NORMAL')
+        database.execute(SCHEMA)
+        _local.database = database
+        _local.key = (os.getpid(), location)
+    return database
+
+
+def flush():
+    """Прибавляет накопленное процессом к счетчикам в общем файле."""
+    global _pending, _last_flush
+    with _lock:
+        pending, _pending = _pending, {}
+        _last_flush = time.monotonic()
+    if not pending:
+        return
+    try:
+        database = _connection()
+        database.execute('BEGIN IMMEDIATE')
+        try:
+            database.executemany(
+                'INSERT INTO metrics (name, labels, value) VALUES (?, ?, ?) '
+                'ON CONFLICT (name, labels) '
+                'DO UPDATE SET value = value + excluded.value',
+                [(name, json.dumps(labels, ensure_ascii=False), value)
+                 for (name, labels), value in pending.items()]
+            )
+        except BaseException:
+            database.execute('ROLLBACK')
+            raise
+        database.execute('COMMIT')
+    except sqlite3.Error:
+        logger.exception('Не удалось сохранить метрики')
+        # Приращения не теряем: попробуем при следующем сбросе.
+        with _lock:
+            for key, value in pending.items():
+                _pending[key] = _pending.get(key, 0) + value
+
+
+def maybe_flush():
+    if time.monotonic() - _last_flush >= settings.METRICS_FLUSH_INTERVAL:
+        flush()
+
+
+atexit.register(flush)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _escape(value):
+    return (
+        str(value).replace('\\', r'\\').replace('"', r'\"')
+        .replace('\n', r'\n')
+    )
+
+
+def _family(name):
+    """Имя гистограммы для ее рядов _bucket, _sum и _count."""
+    base, _, suffix = name.rpartition('_')
+    if suffix in ('bucket', 'sum', 'count') and base in METRICS:
+        return base
+    return name
+
+
+def _sort_key(row):
+    name, labels, _ = row
+    pairs = json.loads(labels)
+    return (
+        _family(name), name,
+        [pair for pair in pairs if pair[0] != 'le'],
+        [pair[1] for pair in pairs if pair[0] == 'le'],
+    )
+
+
+def render():
+    """Все метрики хоста в текстовом формате Prometheus."""
+    flush()
+    rows = _connection().execute(
+        'SELECT name, labels, value FROM metrics'
+    ).fetchall()
+    lines = []
+    family = None
+    for name, labels, value in sorted(rows, key=_sort_key):
+        if _family(name) != family:
+            family = _family(name)
+            kind, help_text = METRICS.get(family, ('untyped', ''))
+            lines.append(f'# HELP {family} {help_text}')
+            lines.append(f'# TYPE {family} {kind}')
+        # le по обычаю последняя метка корзины.
+        pairs = sorted(json.loads(labels), key=lambda pair: pair[0] == 'le')
+        label_text = ','.join(
+            f'{label}="{_escape(_format_value(label_value))}"'
+            if label == 'le' else f'{label}="{_escape(label_value)}"'
+            for label, label_value in pairs
+        )
+        lines.append(
+            f'{name}{{{label_text}}} {_format_value(value)}'
+            if label_text else f'{name} {_format_value(value)}'
+        )
+    return '\n'.join(lines) + '\n'
+
+
+def instrument_templates():
+    """Оборачивает Template.render один раз на процесс."""
+    global _templates_instrumented
+    if _templates_instrumented:
+        return
+    _templates_instrumented = True
+    original = template_base.Template.render
+
+    def render(self, context):
+        start = time.perf_counter()
+        try:
+            return original(self, context)
+        finally:
+            observe(
+                'yatube_template_render_seconds',
+                time.perf_counter() - start,
+                template=self.origin.template_name or self.origin.name
+            )
+
+    template_base.Template.render = render
+
+
+class MetricsMiddleware:
+    """Число и время запросов и SQL по имени URL."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        instrument_templates()
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            response = self.get_response(request)
+        if response.streaming:
+            response.streaming_content = self.stream(
+                response.streaming_content, request, response, counter, start
+            )
+        else:
+            self.record(request, response, counter, start)
+        return response
+
+    def stream(self, content, request, response, counter, start):
+        # Тело потокового ответа (например, /api/v1/export/) читает базу
+        # после выхода из middleware: считаем его запросы и пишем метрики,
+        # когда тело отдано.
+        try:
+            with connection.execute_wrapper(counter):
+                yield from content
+        finally:
+            self.record(request, response, counter, start)
+
+    def record(self, request, response, counter, start):
+        duration = time.perf_counter() - start
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        inc(
+            'yatube_http_requests_total', view=view, method=request.method,
+            status=response.status_code
+        )
+        observe('yatube_http_request_duration_seconds', duration, view=view)
+        inc('yatube_db_queries_total', counter.count, view=view)
+        inc('yatube_db_query_seconds_total', counter.duration, view=view)
+        maybe_flush()
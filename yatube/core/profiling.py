@@ -0,0 +1,184 @@
+"""Профилирование отдельных запросов по требованию.
+
+Запрос профилируется, если в заголовке X-Profile пришел подписанный
+токен (команда profile_token) или он попал в выборку PROFILE_SAMPLE_RATE.
+Для него пишутся дамп cProfile (.prof, смотреть через pstats или
+snakeviz) и отчет .json со временем SQL-запросов и рендера шаблонов. В
+каталоге PROFILE_DIR хранятся только PROFILE_KEEP последних запросов.
+
+Остальные запросы проходят без профилировщика: проверка заголовка и, при
+ненулевой доле выборки, одно random().
+"""
+import cProfile
+import contextvars
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from datetime import datetime
+
+from django.conf import settings
+from django.core import signing
+from django.db import connection
+from django.template import base as template_base
+
+logger = logging.getLogger(__name__)
+
+TOKEN_SALT = 'core.profiling'
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+SQL_PREVIEW_LENGTH = 500
+
+_recorder = contextvars.ContextVar('profile_recorder', default=None)
+_templates_instrumented = False
+
+
+def make_token():
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(uuid.uuid4().hex)
+
+
+def token_valid(token):
+    try:
+        signing.TimestampSigner(salt=TOKEN_SALT).unsign(
+            token, max_age=settings.PROFILE_TOKEN_MAX_AGE
+        )
+    except signing.BadSignature:
+        return False
+    return True
+
+
+class Recorder:
+    """Время SQL-запросов и шаблонов одного запроса."""
+
+    def __init__(self):
+        self.queries = []
+        self.templates = []
+        self.depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'sql': sql[:SQL_PREVIEW_LENGTH],
+                'ms': round((time.perf_counter() - start) * 1e3, 3),
+            })
+
+    def render(self, render, template, context):
+        origin = template.origin
+        start = time.perf_counter()
+        self.depth += 1
+        try:
+            return render(template, context)
+        finally:
+            self.depth -= 1
+            self.templates.append({
+                'name': origin.template_name or origin.name,
+                'depth': self.depth,
+                'ms': round((time.perf_counter() - start) * 1e3, 3),
+            })
+
+
+def instrument_templates():
+    """Оборачивает Template.render один раз на процесс.
+
+    Вне профилируемого запроса обертка сразу вызывает исходный метод.
+    """
+    global _templates_instrumented
+    if _templates_instrumented:
+        return
+    _templates_instrumented = True
+    original = template_base.Template.render
+
+    def render(self, context):
+        recorder = _recorder.get()
+        if recorder is None:
+            return original(self, context)
+        return recorder.render(original, self, context)
+
+    template_base.Template.render = render
+
+
+def rotate(directory, keep):
+    """Оставляет в directory файлы keep последних запросов."""
+    reports = sorted(
+        name for name in os.listdir(directory) if name.endswith('.json')
+    )
+    for name in reports[:-keep] if keep else reports:
+        stem = name[:-len('.json')]
+        for suffix in ('.json', '.prof'):
+            try:
+                os.remove(os.path.join(directory, stem + suffix))
+            except FileNotFoundError:
+                pass
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        instrument_templates()
+
+    def should_profile(self, request):
+        token = request.META.get(PROFILE_HEADER)
+        if token:
+            return token_valid(token)
+        rate = settings.PROFILE_SAMPLE_RATE
+        return rate > 0 and random.random() < rate
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+        recorder = Recorder()
+        profiler = cProfile.Profile()
+        reset = _recorder.set(recorder)
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(recorder):
+                profiler.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    profiler.disable()
+        finally:
+            _recorder.reset(reset)
+        duration_ms = (time.perf_counter() - start) * 1e3
+        try:
+            profile_id = self.save(
+                request, response, profiler, recorder, duration_ms
+            )
+        except OSError:
+            logger.exception('Не удалось сохранить профиль запроса')
+        else:
+            response['X-Profile-Id'] = profile_id
+        return response
+
+    def save(self, request, response, profiler, recorder, duration_ms):
+        directory = settings.PROFILE_DIR
+        os.makedirs(directory, exist_ok=True)
+        match = request.resolver_match
+        view_name = match.view_name if match else 'unresolved'
+        # Имена сортируются по времени: по ним идет ротация.
+        profile_id = '{}-{}-{}'.format(
+            datetime.now().strftime('%Y%m%d-%H%M%S-%f'),
+            view_name.replace(':', '.'),
+            uuid.uuid4().hex[:6],
+        )
+        stem = os.path.join(directory, profile_id)
+        profiler.dump_stats(stem + '.prof')
+        sql_ms = sum(query['ms'] for query in recorder.queries)
+        report = {
+            'path': request.get_full_path(),
+            'method': request.method,
+            'view': view_name,
+            'status': response.status_code,
+            'ms': round(duration_ms, 3),
+            'sql_ms': round(sql_ms, 3),
+            'queries': recorder.queries,
+            'templates': recorder.templates,
+        }
+        with open(stem + '.json', 'w', encoding='utf-8') as stream:
+            json.dump(report, stream, ensure_ascii=False, indent=2)
+        rotate(directory, settings.PROFILE_KEEP)
+        return profile_id
@@ -0,0 +1,87 @@
+"""Бюджеты SQL-запросов на один HTTP-запрос.
+
+Бюджет объявляется в urls.py рядом с маршрутами через register_budgets:
+сколько запросов к базе может сделать view, не считая размера страницы.
+QueryBudgetMiddleware считает запросы и их время для каждого запроса и
+пишет предупреждение в лог, если view вышел за бюджет. В тестах тот же
+бюджет проверяет assert_query_budget.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.urls import reverse
+
+logger = logging.getLogger(__name__)
+
+# Полное имя URL (posts:index, posts-list) -> число запросов.
+QUERY_BUDGETS = {}
+
+
+def register_budgets(budgets, namespace=None):
+    for name, budget in budgets.items():
+        QUERY_BUDGETS[f'{namespace}:{name}' if namespace else name] = budget
+
+
+class QueryCounter:
+    """Обертка connection.execute_wrapper: число и время запросов."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+class QueryBudgetMiddleware:
+    """Считает SQL-запросы запроса и сверяет их с бюджетом view.
+
+    В DEBUG число и время запросов отдаются в заголовке Server-Timing.
+    Запросы, выполненные при отдаче потокового ответа, не учитываются.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = self.get_response(request)
+        duration_ms = counter.duration * 1e3
+        if settings.DEBUG:
+            response['Server-Timing'] = (
+                f'db;dur={duration_ms:.1f};desc="{counter.count} queries"'
+            )
+        match = request.resolver_match
+        budget = match and QUERY_BUDGETS.get(match.view_name)
+        if budget is not None and counter.count > budget:
+            logger.warning(
+                '%s: %d SQL-запросов при бюджете %d, %.1f мс в базе (%s)',
+                match.view_name, counter.count, budget, duration_ms,
+                request.get_full_path()
+            )
+        return response
+
+
+def assert_query_budget(client, view_name, kwargs=None, data=None):
+    """GET на view_name тестовым клиентом; AssertionError, если запросов
+    больше бюджета. Возвращает ответ."""
+    # reverse() загружает urls.py, где и объявлены бюджеты.
+    path = reverse(view_name, kwargs=kwargs)
+    budget = QUERY_BUDGETS.get(view_name)
+    assert budget is not None, f'Для {view_name} не объявлен бюджет'
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        response = client.get(path, data)
+    assert counter.count <= budget, (
+        f'{path}: {counter.count} SQL-запросов при бюджете {budget} '
+        f'для {view_name}'
+    )
+    return response
@@ -0,0 +1,175 @@
+"""Журнал медленных SQL-запросов.
+
+SlowQueryMiddleware замеряет каждый запрос к базе, в том числе сделанный
+при отдаче тела потокового ответа. Запрос дольше
+SLOW_QUERY_MS попадает в SLOW_QUERY_LOG (строка JSON) вместе с планом
+EXPLAIN QUERY PLAN, view, из которого он сделан, и стеком вызовов только
+по файлам проекта. Файл ограничен SLOW_QUERY_LOG_MAX_BYTES: переполненный
+журнал переименовывается в .1, прежний .1 удаляется.
+
+Команда slow_queries сводит записи по форме запроса (normalize) и
+показывает самые затратные.
+"""
+import json
+import logging
+import os
+import re
+import time
+import traceback
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+MAX_PARAMS = 20
+MAX_PARAM_LENGTH = 200
+MAX_SQL_LENGTH = 10000
+EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+# Обертки запросов и middleware замеров: в стеке только шум.
+INSTRUMENTATION_FILES = {
+    os.path.join('core', name)
+    for name in ('metrics.py', 'profiling.py', 'querybudget.py',
+                 'slowqueries.py')
+}
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%s|\?')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_SPACES = re.compile(r'\s+')
+
+
+def normalize(sql):
+    """Форма запроса: литералы и параметры заменены на ?, списки IN
+    любой длины сведены к одному."""
+    shape = _STRING.sub('?', sql)
+    shape = _NUMBER.sub('?', shape)
+    shape = _PLACEHOLDER.sub('?', shape)
+    shape = _IN_LIST.sub('(...)', shape)
+    return _SPACES.sub(' ', shape).strip()
+
+
+def explain(database, sql, params):
+    """Строки плана запроса; None, если план получить не удалось."""
+    if not sql.lstrip().upper().startswith(EXPLAINABLE):
+        return None
+    prefix = (
+        'EXPLAIN QUERY PLAN ' if database.vendor == 'sqlite' else 'EXPLAIN '
+    )
+    try:
+        with database.cursor() as cursor, database.wrap_database_errors:
+            # Курсор драйвера: обертки execute_wrapper план не видят.
+            cursor.cursor.execute(prefix + sql, params)
+            rows = cursor.cursor.fetchall()
+    except DatabaseError:
+        return None
+    if database.vendor != 'sqlite':
+        return [' '.join(str(value) for value in row) for row in rows]
+    # Строки SQLite: (id, parent, 0, detail); глубина по parent.
+    depth = {0: -1}
+    plan = []
+    for node, parent, _, detail in rows:
+        depth[node] = depth.get(parent, -1) + 1
+        plan.append('  ' * depth[node] + detail)
+    return plan
+
+
+def project_stack():
+    """Кадры стека из файлов проекта, без библиотек и замеров."""
+    root = str(settings.BASE_DIR) + os.sep
+    frames = []
+    for frame in traceback.extract_stack():
+        filename = frame.filename
+        if not filename.startswith(root) or 'site-packages' in filename:
+            continue
+        filename = os.path.relpath(filename, root)
+        if filename not in INSTRUMENTATION_FILES:
+            frames.append(f'{filename}:{frame.lineno} in {frame.name}')
+    return frames
+
+
+def write(record):
+    """Дописывает запись в журнал, переименовывая переполненный."""
+    path = settings.SLOW_QUERY_LOG
+    line = json.dumps(record, ensure_ascii=False, default=str) + '\n'
+    try:
+        if os.path.getsize(path) >= settings.SLOW_QUERY_LOG_MAX_BYTES:
+            os.replace(path, path + '.1')
+    except FileNotFoundError:
+        pass
+    try:
+        with open(path, 'a', encoding='utf-8') as stream:
+            stream.write(line)
+    except OSError:
+        logger.exception('Не удалось записать медленный запрос')
+
+
+def read(path):
+    """Записи журнала и его предыдущей части .1, от старых к новым."""
+    for name in (path + '.1', path):
+        try:
+            with open(name, encoding='utf-8') as stream:
+                for line in stream:
+                    if line.strip():
+                        yield json.loads(line)
+        except FileNotFoundError:
+            continue
+
+
+class SlowQueryRecorder:
+    """Обертка connection.execute_wrapper для одного HTTP-запроса."""
+
+    def __init__(self, request):
+        self.request = request
+        self.threshold = settings.SLOW_QUERY_MS / 1e3
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration = time.perf_counter() - start
+        if duration >= self.threshold:
+            self.record(context['connection'], sql, params, many, duration)
+        return result
+
+    def record(self, database, sql, params, many, duration):
+        match = self.request.resolver_match
+        write({
+            'time': timezone.now().isoformat(),
+            'ms': round(duration * 1e3, 3),
+            'sql': sql[:MAX_SQL_LENGTH],
+            'params': [
+                repr(param)[:MAX_PARAM_LENGTH]
+                for param in list(params or ())[:MAX_PARAMS]
+            ] if not many else [],
+            'many': many,
+            'view': match.view_name if match else None,
+            'method': self.request.method,
+            'path': self.request.get_full_path(),
+            # У executemany нет одного набора параметров для плана.
+            'plan': None if many else explain(database, sql, params),
+            'stack': project_stack(),
+        })
+
+
+class SlowQueryMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = SlowQueryRecorder(request)
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        if response.streaming:
+            response.streaming_content = self.stream(
+                response.streaming_content, recorder
+            )
+        return response
+
+    @staticmethod
+    def stream(content, recorder):
+        # Тело потокового ответа (например, /api/v1/export/) читает базу
+        # уже после выхода из middleware, пока сервер отдает его клиенту.
+        with connection.execute_wrapper(recorder):
+            yield from content
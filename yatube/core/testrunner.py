@@ -0,0 +1,53 @@
+"""Тесты на временных файлах вместо файлов рядом с проектом.
+
+Кэш SQLiteCache, счетчики метрик и загруженные картинки хранятся в
+BASE_DIR. Без подмены тесты читали бы записи, оставшиеся от разработки,
+cache.clear() стирал бы кэш разработчика, тестовые запросы попадали бы в
+его /metrics/, а картинки и миниатюры тестов — в media.
+TestRunner (settings.TEST_RUNNER) и фикстура pytest isolated_files
+переносят такие файлы во временный каталог (temporary_files).
+"""
+import copy
+import os
+import tempfile
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from . import metrics
+
+FILE_CACHE_BACKENDS = ('core.cache.SQLiteCache',)
+
+
+@contextmanager
+def temporary_files():
+    with tempfile.TemporaryDirectory() as directory:
+        caches = copy.deepcopy(settings.CACHES)
+        for alias, options in caches.items():
+            if options['BACKEND'] in FILE_CACHE_BACKENDS:
+                options['LOCATION'] = os.path.join(
+                    directory, f'cache-{alias}.sqlite3'
+                )
+        metrics_database = os.path.join(directory, 'metrics.sqlite3')
+        with override_settings(
+            CACHES=caches, METRICS_DATABASE=metrics_database,
+            MEDIA_ROOT=os.path.join(directory, 'media'),
+        ):
+            try:
+                yield directory
+            finally:
+                # Иначе накопленное сбросит atexit, уже в настоящий файл.
+                metrics.flush()
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._files = ExitStack()
+        self._files.enter_context(temporary_files())
+
+    def teardown_test_environment(self, **kwargs):
+        self._files.close()
+        super().teardown_test_environment(**kwargs)
@@ -1,6 +1,30 @@
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
 from http import HTTPStatus
+from io import StringIO
+from unittest import mock
 
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from posts.models import Follow, Post
+from posts.synthetic import SyntheticData
+from rest_framework.test import APIClient
+
+from . import metrics
+from .cache import CULL_EVERY, SQLiteCache
+from .profiling import rotate
+from .slowqueries import normalize, read, write
+
+User = get_user_model()
 
 
 class ViewTestClass(TestCase):
@@ -18,3 +42,371 @@ class ViewTestClass(TestCase):
             with self.subTest(address=address):
                 response = self.client.get(address)
                 self.assertTemplateUsed(response, template)
+
+
+class SQLiteCacheTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.location = os.path.join(directory.name, 'cache.sqlite3')
+        self.cache = SQLiteCache(self.location, {})
+
+    def test_tests_use_temporary_files(self):
+        """Тесты не трогают кэш и метрики разработчика в BASE_DIR."""
+        for location in (settings.CACHES['default']['LOCATION'],
+                         settings.METRICS_DATABASE):
+            self.assertNotEqual(
+                os.path.dirname(location), str(settings.BASE_DIR)
+            )
+
+    def test_shared_between_instances(self):
+        """Запись одного экземпляра (воркера) видна другому."""
+        other = SQLiteCache(self.location, {})
+        self.cache.set('key', {'value': 1})
+        self.assertEqual(other.get('key'), {'value': 1})
+        other.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_add_incr_and_expiry(self):
+        """add не перезаписывает, incr атомарен, просроченное не читается."""
+        self.assertTrue(self.cache.add('counter', 1))
+        self.assertFalse(self.cache.add('counter', 5))
+        self.assertEqual(self.cache.incr('counter'), 2)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+        self.cache.set('expired', 'value', timeout=-1)
+        self.assertIsNone(self.cache.get('expired'))
+        self.assertEqual(
+            self.cache.get_many(['counter', 'expired']), {'counter': 2}
+        )
+
+    def test_cull_evicts_least_recently_used(self):
+        """При переполнении вытесняются давно не читавшиеся записи."""
+        cache = SQLiteCache(self.location, {
+            'OPTIONS': {'MAX_ENTRIES': 10, 'CULL_FREQUENCY': 2},
+        })
+        for i in range(CULL_EVERY):
+            cache.set(f'key{i}', i)
+        self.assertIsNone(cache.get('key0'))
+        self.assertEqual(cache.get(f'key{CULL_EVERY - 1}'), CULL_EVERY - 1)
+
+
+class BenchmarkTest(TestCase):
+    def test_synthetic_data_is_reproducible(self):
+        """Один seed дает одни и те же записи."""
+        def records(seed):
+            data = SyntheticData(seed=seed, users=30, posts=40, comments=20)
+            return (
+                list(data.users()), list(data.follows()),
+                list(data.posts()), list(data.comments()),
+            )
+        self.assertEqual(records(5), records(5))
+        self.assertNotEqual(records(5)[2], records(6)[2])
+
+    def test_synthetic_data_does_not_depend_on_hash_seed(self):
+        """Подписки одинаковы в процессах с разным PYTHONHASHSEED."""
+        script = (
+            'import django; django.setup(); '
+            'from posts.synthetic import SyntheticData; '
+            'print(list(SyntheticData(seed=5, users=50).follows()))'
+        )
+        outputs = {
+            subprocess.run(
+                [sys.executable, '-c', script], cwd=settings.BASE_DIR,
+                env={**os.environ, 'PYTHONHASHSEED': hash_seed,
+                     'DJANGO_SETTINGS_MODULE': 'yatube.settings'},
+                capture_output=True, text=True, check=True
+            ).stdout
+            for hash_seed in ('1', '2')
+        }
+        self.assertEqual(len(outputs), 1)
+
+    def test_generate_and_benchmark(self):
+        call_command(
+            'generate_data', users=20, posts=60, comments=30,
+            image_ratio=0, stdout=StringIO()
+        )
+        self.assertEqual(Post.objects.count(), 60)
+        self.assertTrue(Follow.objects.exists())
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        output = os.path.join(directory.name, 'baseline.json')
+        call_command(
+            'benchmark_urls', iterations=2, warmup=0, output=output,
+            names=['posts:index', 'posts:profile', 'posts-list'],
+            stdout=StringIO()
+        )
+        with open(output, encoding='utf-8') as stream:
+            report = json.load(stream)
+        self.assertEqual(report['dataset']['posts'], 60)
+        self.assertEqual(
+            set(report['urls']),
+            {'posts:index', 'posts:profile', 'posts-list'}
+        )
+        for result in report['urls'].values():
+            self.assertEqual(result['status'], 200)
+            self.assertGreater(result['queries'], 0)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+
+    def test_compare_counts_errors_and_missing_urls(self):
+        """Новая ошибка и пропавший из замера URL — ухудшения."""
+        ok = {
+            'status': 200, 'p50_ms': 5.0, 'p95_ms': 10.0, 'p99_ms': 12.0,
+            'queries': 3,
+        }
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        baseline = os.path.join(directory.name, 'baseline.json')
+        with open(baseline, 'w', encoding='utf-8') as stream:
+            json.dump({'urls': {
+                'posts:index': ok, 'posts:profile': ok, 'posts-list': ok,
+                'posts:group_list': {'error': 'нет данных'},
+            }}, stream)
+        results = {
+            'posts:index': ok,
+            'posts:profile': {'error': 'ZeroDivisionError'},
+            'posts:group_list': {'error': 'нет данных'},
+        }
+        for names, regressions in (
+            (None, 'posts-list, posts:profile'),
+            (list(results), 'posts:profile'),
+        ):
+            with self.subTest(names=names), mock.patch(
+                'core.benchmark.run', return_value=results
+            ), self.assertRaisesMessage(CommandError, regressions):
+                call_command(
+                    'benchmark_urls', compare=baseline, names=names,
+                    stdout=StringIO(), stderr=StringIO()
+                )
+
+
+class ProfilingTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        overrides = override_settings(
+            PROFILE_DIR=self.directory, PROFILE_SAMPLE_RATE=0
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def token(self):
+        stdout = StringIO()
+        call_command('profile_token', stdout=stdout)
+        return stdout.getvalue().strip()
+
+    def test_token_profiles_request(self):
+        """Запрос с токеном пишет дамп cProfile и отчет с SQL и
+        шаблонами."""
+        Post.objects.create(
+            text='Текст', author=User.objects.create_user('author')
+        )
+        response = self.client.get('/', HTTP_X_PROFILE=self.token())
+        profile_id = response['X-Profile-Id']
+        self.assertEqual(
+            sorted(os.listdir(self.directory)),
+            [profile_id + '.json', profile_id + '.prof']
+        )
+        path = os.path.join(self.directory, profile_id + '.json')
+        with open(path, encoding='utf-8') as stream:
+            report = json.load(stream)
+        self.assertEqual(report['view'], 'posts:index')
+        self.assertEqual(report['status'], 200)
+        self.assertTrue(report['queries'])
+        self.assertIn(
+            'posts/index.html',
+            [template['name'] for template in report['templates']]
+        )
+
+    def test_without_token_nothing_is_written(self):
+        for headers in ({}, {'HTTP_X_PROFILE': 'forged:token'}):
+            with self.subTest(headers=headers):
+                response = self.client.get('/', **headers)
+                self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    @override_settings(PROFILE_SAMPLE_RATE=1)
+    def test_sampled_request_is_profiled(self):
+        response = self.client.get(reverse('posts:group_list'))
+        self.assertIn('X-Profile-Id', response)
+
+    def test_rotate_keeps_latest(self):
+        for stem in ('1', '2', '3'):
+            for suffix in ('.json', '.prof'):
+                open(os.path.join(self.directory, stem + suffix), 'w').close()
+        rotate(self.directory, 2)
+        self.assertEqual(
+            sorted(os.listdir(self.directory)),
+            ['2.json', '2.prof', '3.json', '3.prof']
+        )
+
+
+def _inc_in_child():
+    metrics.inc('yatube_db_queries_total', 5, view='worker')
+    metrics.flush()
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        overrides = override_settings(
+            METRICS_DATABASE=os.path.join(directory.name, 'metrics.sqlite3'),
+            METRICS_FLUSH_INTERVAL=0,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def sample(self, series):
+        """Значение ряда из ответа /metrics/, 0 если его нет."""
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        for line in response.content.decode().splitlines():
+            if line.startswith(series + ' '):
+                return float(line.rsplit(' ', 1)[1])
+        return 0
+
+    def test_key_prefix(self):
+        prefixes = {
+            'posts:card:5:ab12': 'posts:card',
+            'posts:generation': 'posts:generation',
+            'template.cache.index_page.ab12': 'template.cache.index_page',
+            'sorl-thumbnail||image||ab12': 'sorl-thumbnail:image',
+        }
+        for key, prefix in prefixes.items():
+            with self.subTest(key=key):
+                self.assertEqual(metrics.key_prefix(key), prefix)
+
+    def test_requests_queries_templates_and_cache(self):
+        series = {
+            'requests': 'yatube_http_requests_total'
+                        '{method="GET",status="200",view="posts:index"}',
+            'latency': 'yatube_http_request_duration_seconds_bucket'
+                       '{view="posts:index",le="+Inf"}',
+            'queries': 'yatube_db_queries_total{view="posts:index"}',
+            'template': 'yatube_template_render_seconds_count'
+                        '{template="posts/index.html"}',
+            'hit': 'yatube_cache_requests_total'
+                   '{prefix="template.cache.index_page",result="hit"}',
+            'miss': 'yatube_cache_requests_total'
+                    '{prefix="template.cache.index_page",result="miss"}',
+        }
+        before = {key: self.sample(name) for key, name in series.items()}
+        self.client.get(reverse('posts:index'))
+        self.client.get(reverse('posts:index'))
+        after = {key: self.sample(name) for key, name in series.items()}
+        self.assertEqual(after['requests'] - before['requests'], 2)
+        self.assertEqual(after['latency'] - before['latency'], 2)
+        self.assertEqual(after['template'] - before['template'], 2)
+        self.assertGreater(after['queries'], before['queries'])
+        self.assertGreaterEqual(after['miss'] - before['miss'], 1)
+        self.assertGreaterEqual(after['hit'] - before['hit'], 1)
+
+    def test_streaming_response_queries(self):
+        """Запросы при отдаче потокового ответа входят в метрики."""
+        user = User.objects.create_user('author')
+        for number in range(3):
+            Post.objects.create(text=f'Пост {number}', author=user)
+        client = APIClient()
+        client.force_authenticate(user)
+        series = 'yatube_db_queries_total{view="export"}'
+        before = self.sample(series)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get('/api/v1/export/', {'chunk_size': 1})
+            b''.join(response.streaming_content)
+        # Запрос к /metrics/ очищает connection.queries.
+        count = len(queries)
+        self.assertGreater(count, 3)
+        self.assertEqual(self.sample(series) - before, count)
+
+    def test_processes_share_counters(self):
+        series = 'yatube_db_queries_total{view="worker"}'
+        metrics.flush()
+        process = multiprocessing.get_context('fork').Process(
+            target=_inc_in_child
+        )
+        process.start()
+        process.join()
+        self.assertEqual(self.sample(series), 5)
+
+    def test_forbidden_for_other_addresses(self):
+        response = self.client.get(
+            reverse('metrics'), REMOTE_ADDR='192.0.2.1'
+        )
+        self.assertEqual(response.status_code, HTTPStatus.FORBIDDEN)
+
+
+class SlowQueryTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.log = os.path.join(directory.name, 'slow.log')
+        overrides = override_settings(
+            SLOW_QUERY_MS=0, SLOW_QUERY_LOG=self.log
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def test_normalize(self):
+        self.assertEqual(
+            normalize(
+                'SELECT "posts_post"."id" FROM "posts_post"\n'
+                "WHERE id IN (%s, %s, %s) AND text = 'it''s' LIMIT 10"
+            ),
+            'SELECT "posts_post"."id" FROM "posts_post" '
+            'WHERE id IN (...) AND text = ? LIMIT ?'
+        )
+
+    def test_records_plan_view_and_project_stack(self):
+        Post.objects.create(
+            text='Текст', author=User.objects.create_user('author')
+        )
+        self.client.get(reverse('posts:profile', args=['author']))
+        records = [
+            record for record in read(self.log)
+            if record['sql'].startswith('SELECT')
+        ]
+        self.assertTrue(records)
+        record = records[0]
+        self.assertEqual(record['view'], 'posts:profile')
+        self.assertTrue(record['plan'])
+        self.assertTrue(record['stack'])
+        self.assertFalse([
+            frame for frame in record['stack']
+            if 'site-packages' in frame or 'querybudget' in frame
+        ])
+        self.assertTrue(any(
+            frame.startswith(os.path.join('posts', 'views.py'))
+            for record in records for frame in record['stack']
+        ))
+        stdout = StringIO()
+        call_command('slow_queries', limit=3, stdout=stdout)
+        self.assertIn('posts:profile', stdout.getvalue())
+        self.assertIn('план:', stdout.getvalue())
+
+    def test_records_streaming_response_queries(self):
+        """Запросы при отдаче потокового ответа тоже попадают в журнал."""
+        user = User.objects.create_user('author')
+        Post.objects.create(text='Текст', author=user)
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get('/api/v1/export/')
+        self.assertFalse([
+            record for record in read(self.log)
+            if 'posts_post' in record['sql']
+        ])
+        b''.join(response.streaming_content)
+        records = [
+            record for record in read(self.log)
+            if 'posts_post' in record['sql']
+        ]
+        self.assertTrue(records)
+        self.assertEqual(records[0]['view'], 'export')
+
+    @override_settings(SLOW_QUERY_LOG_MAX_BYTES=100)
+    def test_log_is_bounded(self):
+        for number in range(5):
+            write({'sql': 'SELECT ' + 'x' * 100, 'ms': number})
+        self.assertTrue(os.path.exists(self.log + '.1'))
+        self.assertEqual([record['ms'] for record in read(self.log)], [3, 4])
@@ -1,7 +1,11 @@
 from http import HTTPStatus
 
+from django.conf import settings
+from django.http import HttpResponse
 from django.shortcuts import render
 
+from . import metrics as app_metrics
+
 
 def page_not_found(request, exception):
     return render(
@@ -26,3 +30,12 @@ def permission_denied(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+def metrics(request):
+    """Метрики для Prometheus; только с адресов METRICS_ALLOWED_IPS."""
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponse(status=HTTPStatus.FORBIDDEN)
+    return HttpResponse(
+        app_metrics.render(), content_type=app_metrics.CONTENT_TYPE
+    )
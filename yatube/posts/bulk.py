@@ -0,0 +1,62 @@
+"""Массовое создание постов и комментариев одним bulk_create.
+
+bulk_create не посылает post_save, поэтому то, что для одиночной записи
+делают обработчики из posts.signals — ленты подписчиков, счетчики,
+поисковый индекс и номер поколения кеша, — здесь выполняется пачками
+для всех созданных объектов сразу.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Max
+
+from . import counters, search, timeline
+from .caching import bump_generation
+from .models import Comment, Post
+
+
+def assign_pks(model, objs):
+    """Проставляет id объектам после bulk_create.
+
+    SQLite в Django 2.2 не возвращает id вставленных строк. Внутри
+    транзакции запись в SQLite монопольна, а id с AUTOINCREMENT растут
+    подряд, так что последние len(objs) id принадлежат этим объектам.
+    """
+    if not objs or objs[0].pk is not None:
+        return
+    last_pk = model.objects.aggregate(last=Max('pk'))['last']
+    first_pk = last_pk - len(objs) + 1
+    for pk, obj in enumerate(objs, start=first_pk):
+        obj.pk = pk
+
+
+def bulk_create_posts(posts):
+    posts = list(posts)
+    if not posts:
+        return posts
+    with transaction.atomic():
+        Post.objects.bulk_create(posts)
+        assign_pks(Post, posts)
+        for post in posts:
+            post._loaded_image = post.image.name
+        timeline.fan_out_posts(posts)
+        search.index_new_posts(posts)
+        authors = Counter(post.author_id for post in posts)
+        for author_id, created in authors.items():
+            counters.change_user_counter(author_id, 'posts_count', created)
+    bump_generation()
+    return posts
+
+
+def bulk_create_comments(comments):
+    comments = list(comments)
+    if not comments:
+        return comments
+    with transaction.atomic():
+        Comment.objects.bulk_create(comments)
+        assign_pks(Comment, comments)
+        commented = Counter(comment.post_id for comment in comments)
+        for post_id, created in commented.items():
+            counters.change_comment_count(post_id, created)
+    bump_generation()
+    return comments
@@ -0,0 +1,72 @@
+"""Ключи кеша фрагментов лент и карточек постов.
+
+Номер поколения входит в ключ каждого фрагмента ленты. Любая запись
+Post, Comment или Group и смена имени пользователя увеличивают номер, и
+старые фрагменты просто перестают читаться, поэтому их можно хранить
+часами. Тот же номер служит ETag страниц и API (posts.conditional).
+
+Карточка поста кешируется отдельно и общая для всех читателей: ее ключ
+зависит только от полей, которые в нее попадают.
+"""
+import hashlib
+import time
+
+from django.core.cache import cache
+
+GENERATION_KEY = 'posts:generation'
+# Время последнего увеличения номера: Last-Modified лент (conditional).
+CHANGED_KEY = 'posts:changed'
+FEED_CACHE_TIMEOUT = 60 * 60 * 6
+CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def get_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # Если номер вытеснен из кеша, начинаем с текущего времени в мс:
+        # новое значение заведомо больше всех выданных ранее.
+        cache.add(GENERATION_KEY, int(time.time() * 1000), None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def bump_generation():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        get_generation()
+    cache.set(CHANGED_KEY, time.time(), None)
+
+
+def generation_and_change():
+    """Номер поколения и время его последнего увеличения (или None)
+    одним чтением кеша."""
+    values = cache.get_many([GENERATION_KEY, CHANGED_KEY])
+    generation = values.get(GENERATION_KEY)
+    if generation is None:
+        generation = get_generation()
+    return generation, values.get(CHANGED_KEY)
+
+
+def feed_cache_context():
+    """Переменные шаблона для тега {% cache %} лент."""
+    return {
+        'cache_generation': get_generation(),
+        'cache_timeout': FEED_CACHE_TIMEOUT,
+    }
+
+
+def card_cache_key(post):
+    """Ключ карточки: меняется при редактировании поста, новом
+    комментарии, готовых версиях картинки, переименовании автора или
+    группы."""
+    version = '|'.join(str(value) for value in (
+        post.updated.timestamp(),
+        post.comment_count,
+        post.image_variants,
+        post.author.username,
+        post.group.slug if post.group else '',
+        post.group.title if post.group else '',
+    ))
+    digest = hashlib.md5(version.encode()).hexdigest()
+    return f'posts:card:{post.id}:{digest}'
@@ -0,0 +1,58 @@
+"""Условные GET-запросы: ETag и Last-Modified без рендера страницы.
+
+Состояние лент и постов — номер поколения кеша (posts.caching): его
+увеличивает любая запись поста, комментария или группы, смена имени
+автора и готовые версии картинки, в том числе удаление. Поэтому
+проверка стоит одного чтения кеша, без агрегатов по таблицам.
+Last-Modified — время последнего увеличения номера. Если клиент прислал
+тот же ETag, view не выполняется и ответом будет 304.
+"""
+import hashlib
+from datetime import datetime, timezone
+
+from django.views.decorators.http import condition
+
+from .caching import generation_and_change
+
+
+def generation_state(**extra):
+    """Состояние по номеру поколения; extra — то, что номер не
+    отслеживает (подписки)."""
+    generation, changed = generation_and_change()
+    return {
+        'generation': generation,
+        'last_modified': (
+            datetime.fromtimestamp(changed, timezone.utc)
+            if changed is not None else None
+        ),
+        **extra,
+    }
+
+
+def state_etag(state, *parts):
+    payload = repr((sorted(state.items()), parts))
+    return hashlib.md5(payload.encode()).hexdigest()
+
+
+def conditional_page(get_state):
+    """Декоратор view: ETag и Last-Modified по get_state(request, ...).
+
+    Состояние запоминается на запросе, чтобы condition() не считал его
+    дважды. Шапка и кнопки страницы зависят от пользователя, поэтому он
+    входит в ETag, а Last-Modified, который пользователя не различает,
+    отдается только анонимам.
+    """
+    def state(request, *args, **kwargs):
+        if not hasattr(request, '_page_state'):
+            request._page_state = get_state(request, *args, **kwargs)
+        return request._page_state
+
+    def etag(request, *args, **kwargs):
+        return state_etag(state(request, *args, **kwargs), request.user.pk)
+
+    def last_modified(request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return None
+        return state(request, *args, **kwargs)['last_modified']
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
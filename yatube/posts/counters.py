@@ -0,0 +1,170 @@
+"""Денормализованные счетчики постов, комментариев и подписок.
+
+Счетчики меняются атомарно через F()-выражения в обработчиках сигналов,
+а накопившееся расхождение чинит команда reconcile_counters.
+"""
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Post, UserStats
+
+# Сколько раз перепроверять запись, которую меняли во время сверки.
+RECONCILE_ATTEMPTS = 3
+
+
+def count_user_stats(user_ids):
+    """Фактические значения счетчиков для пользователей user_ids."""
+    stats = {
+        user_id: {
+            'posts_count': 0,
+            'followers_count': 0,
+            'following_count': 0,
+        }
+        for user_id in user_ids
+    }
+    queries = (
+        ('posts_count', Post.objects, 'author'),
+        ('followers_count', Follow.objects, 'author'),
+        ('following_count', Follow.objects, 'user'),
+    )
+    for counter, manager, field in queries:
+        rows = manager.filter(
+            **{f'{field}__in': user_ids}
+        ).order_by().values(field).annotate(total=Count('id'))
+        for row in rows:
+            stats[row[field]][counter] = row['total']
+    return stats
+
+
+def user_stats(user):
+    """Счетчики пользователя; недостающая запись создается по факту."""
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        stats, _ = UserStats.objects.get_or_create(
+            user_id=user.id, defaults=count_user_stats([user.id])[user.id]
+        )
+        return stats
+
+
+def change_user_counter(user_id, counter, delta):
+    updated = UserStats.objects.filter(user_id=user_id).update(
+        **{counter: F(counter) + delta}
+    )
+    if not updated and delta > 0:
+        # Записи еще нет: создаем ее сразу с фактическими значениями,
+        # в которые уже входит это изменение.
+        _, created = UserStats.objects.get_or_create(
+            user_id=user_id, defaults=count_user_stats([user_id])[user_id]
+        )
+        if not created:
+            change_user_counter(user_id, counter, delta)
+
+
+def change_comment_count(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comment_count=F('comment_count') + delta
+    )
+
+
+def reconcile_posts(post_ids, attempts=RECONCILE_ATTEMPTS):
+    """Исправляет comment_count у постов post_ids, возвращает число правок.
+
+    Сохраненные значения читаются раньше фактических, а правка пишется
+    только поверх прочитанного значения. Если его успел изменить сигнал,
+    пост проверяется заново.
+    """
+    fixed = 0
+    changed = []
+    with transaction.atomic():
+        stored = dict(Post.objects.filter(pk__in=post_ids).values_list(
+            'pk', 'comment_count'
+        ))
+        actual = dict.fromkeys(stored, 0)
+        actual.update(
+            Comment.objects.filter(post_id__in=stored).order_by().values(
+                'post_id'
+            ).annotate(total=Count('id')).values_list('post_id', 'total')
+        )
+        for post_id, comment_count in stored.items():
+            if comment_count == actual[post_id]:
+                continue
+            if Post.objects.filter(
+                pk=post_id, comment_count=comment_count
+            ).update(comment_count=actual[post_id]):
+                fixed += 1
+            else:
+                changed.append(post_id)
+    if changed and attempts > 1:
+        fixed += reconcile_posts(changed, attempts - 1)
+    return fixed
+
+
+def reconcile_users(user_ids, attempts=RECONCILE_ATTEMPTS):
+    """Исправляет счетчики пользователей user_ids, возвращает число правок.
+
+    Порядок чтения и запись поверх прочитанного — как в reconcile_posts.
+    """
+    counters = ('posts_count', 'followers_count', 'following_count')
+    fixed = 0
+    changed = []
+    with transaction.atomic():
+        stored = {
+            stats.user_id: {
+                counter: getattr(stats, counter) for counter in counters
+            }
+            for stats in UserStats.objects.filter(user_id__in=user_ids)
+        }
+        actual = count_user_stats(user_ids)
+        for user_id in user_ids:
+            if stored.get(user_id) == actual[user_id]:
+                continue
+            if user_id in stored:
+                saved = UserStats.objects.filter(
+                    user_id=user_id, **stored[user_id]
+                ).update(**actual[user_id])
+            else:
+                _, saved = UserStats.objects.get_or_create(
+                    user_id=user_id, defaults=actual[user_id]
+                )
+            if saved:
+                fixed += 1
+            else:
+                changed.append(user_id)
+    if changed and attempts > 1:
+        fixed += reconcile_users(changed, attempts - 1)
+    return fixed
+
+
+def recount(user_ids, post_ids=None, batch_size=1000):
+    """Пересчитывает счетчики с нуля, без сравнения с текущими.
+
+    Для массовой загрузки: comment_count постов post_ids (всех, если None)
+    обновляется UPDATE с подзапросом, записи UserStats пользователей
+    user_ids пересоздаются пачками.
+    """
+    comments = Comment.objects.filter(post=OuterRef('pk')).order_by().values(
+        'post'
+    ).annotate(total=Count('pk')).values('total')
+    comment_count = Coalesce(
+        Subquery(comments, output_field=IntegerField()), 0
+    )
+    if post_ids is None:
+        Post.objects.update(comment_count=comment_count)
+    else:
+        post_ids = list(post_ids)
+        for start in range(0, len(post_ids), batch_size):
+            Post.objects.filter(
+                pk__in=post_ids[start:start + batch_size]
+            ).update(comment_count=comment_count)
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), batch_size):
+        chunk = user_ids[start:start + batch_size]
+        stats = count_user_stats(chunk)
+        with transaction.atomic():
+            UserStats.objects.filter(user_id__in=chunk).delete()
+            UserStats.objects.bulk_create(
+                UserStats(user_id=user_id, **counters)
+                for user_id, counters in stats.items()
+            )
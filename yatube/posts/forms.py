@@ -1,4 +1,6 @@
 from django import forms
+from django.core.exceptions import ValidationError
+from . import images
 from .models import Post, Comment
 
 
@@ -7,6 +9,33 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ('text', 'group', 'image')
 
+    def clean_image(self):
+        image = self.cleaned_data['image']
+        if image and 'image' in self.changed_data:
+            # Заголовок проверяется до того, как картинка раскодируется.
+            images.validate_image(image)
+            return images.normalize_upload(image)
+        return image
+
+    def clean(self):
+        cleaned_data = super().clean()
+        upload = self.files.get(self.add_prefix('image'))
+        if upload is not None and upload.size > images.MAX_UPLOAD_SIZE:
+            # Обработчик загрузки обрезал файл, и ImageField считает его
+            # битым; настоящая причина ошибки — размер.
+            self.errors.pop('image', None)
+            try:
+                images.validate_image(upload)
+            except ValidationError as error:
+                self.add_error('image', error)
+        return cleaned_data
+
+    def save(self, commit=True):
+        # Версии старой картинки больше не подходят, новые строятся в фоне.
+        if 'image' in self.changed_data:
+            self.instance.image_variants = False
+        return super().save(commit)
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
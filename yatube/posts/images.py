@@ -0,0 +1,157 @@
+"""Обработка картинок постов при загрузке.
+
+Загруженная картинка поворачивается по EXIF, теряет метаданные (в том
+числе геотеги) и уменьшается до MAX_IMAGE_SIDE по большей стороне. После
+сохранения поста в фоне строятся версии карточки нескольких ширин в JPEG
+и, если Pillow собран с libwebp, в WebP: шаблон отдает их через srcset,
+и браузер скачивает картинку по ширине экрана.
+
+До любой обработки validate_image проверяет размер файла и по заголовку
+формат и число пикселей: картинка-бомба отклоняется, не будучи
+раскодированной.
+"""
+import os
+from io import BytesIO
+
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, features
+
+MAX_UPLOAD_SIZE = 20 * 1024 * 1024
+# Раскодированная RGB-картинка занимает 3 байта на пиксель: до ~120 МБ.
+MAX_IMAGE_PIXELS = 40_000_000
+ALLOWED_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+MAX_IMAGE_SIDE = 2560
+# Пропорции картинки в карточке, как у миниатюры 960x339 в post_item.html.
+CARD_WIDTH, CARD_HEIGHT = 960, 339
+VARIANT_WIDTHS = (480, 960, 1920)
+VARIANTS_DIR = 'posts/variants/'
+WEBP_SUPPORTED = features.check('webp')
+SAVE_OPTIONS = {
+    'JPEG': {'quality': 85, 'optimize': True, 'progressive': True},
+    'PNG': {'optimize': True},
+    'WEBP': {'quality': 80, 'method': 4},
+}
+
+
+def variant_formats():
+    return ('jpg', 'webp') if WEBP_SUPPORTED else ('jpg',)
+
+
+def validate_image(value):
+    """Проверяет размер файла и заголовок картинки, не раскодируя ее."""
+    if getattr(value, '_committed', False):
+        # Уже сохраненная картинка проверена при загрузке.
+        return
+    if value.size > MAX_UPLOAD_SIZE:
+        raise ValidationError(
+            'Файл больше %(limit)d МБ.',
+            code='file_too_large',
+            params={'limit': MAX_UPLOAD_SIZE // (1024 * 1024)},
+        )
+    upload = getattr(value, 'file', value)
+    upload.seek(0)
+    try:
+        # Image.open читает только заголовок.
+        with Image.open(upload) as image:
+            image_format = image.format
+            width, height = image.size
+    except (OSError, Image.DecompressionBombError):
+        raise ValidationError(
+            'Загрузите правильное изображение.', code='invalid_image'
+        )
+    finally:
+        upload.seek(0)
+    if image_format not in ALLOWED_FORMATS:
+        raise ValidationError(
+            'Формат %(format)s не поддерживается.',
+            code='invalid_format',
+            params={'format': image_format},
+        )
+    if width * height > MAX_IMAGE_PIXELS:
+        raise ValidationError(
+            'Картинка %(width)dx%(height)d слишком большая.',
+            code='too_many_pixels',
+            params={'width': width, 'height': height},
+        )
+
+
+def normalize_upload(upload):
+    """Повернутая, очищенная от метаданных и уменьшенная копия загрузки.
+
+    Анимированные картинки возвращаются как есть: пересохранение оставило
+    бы от них один кадр.
+    """
+    upload.seek(0)
+    image = Image.open(upload)
+    if getattr(image, 'is_animated', False):
+        upload.seek(0)
+        return upload
+    image_format = image.format
+    # JPEG раскодируется сразу в уменьшенном масштабе, если это возможно.
+    image.draft(image.mode, (MAX_IMAGE_SIDE, MAX_IMAGE_SIDE))
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((MAX_IMAGE_SIDE, MAX_IMAGE_SIDE), Image.LANCZOS)
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    # Без exif= и pnginfo= Pillow не переносит метаданные в новый файл.
+    image.save(buffer, format=image_format,
+               **SAVE_OPTIONS.get(image_format, {}))
+    return ContentFile(buffer.getvalue(), name=upload.name)
+
+
+def variant_name(image_name, width, extension):
+    # Расширение оригинала входит в имя: a.png и a.jpg не пересекутся.
+    stem = os.path.basename(image_name).replace('.', '_')
+    return f'{VARIANTS_DIR}{stem}_{width}w.{extension}'
+
+
+def write_variants(image_name, storage=default_storage):
+    """Записывает недостающие версии карточки.
+
+    Имя картинки определяет ее содержимое (posts.storage), поэтому уже
+    записанные версии остаются верными.
+    """
+    names = {
+        (width, extension): variant_name(image_name, width, extension)
+        for width in VARIANT_WIDTHS for extension in variant_formats()
+    }
+    missing = {
+        key: name for key, name in names.items() if not storage.exists(name)
+    }
+    if not missing:
+        return
+    with storage.open(image_name) as source:
+        image = Image.open(source)
+        image.load()
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    for width in VARIANT_WIDTHS:
+        height = round(width * CARD_HEIGHT / CARD_WIDTH)
+        variant = ImageOps.fit(image, (width, height), Image.LANCZOS)
+        for extension in variant_formats():
+            if (width, extension) not in missing:
+                continue
+            image_format = 'WEBP' if extension == 'webp' else 'JPEG'
+            buffer = BytesIO()
+            variant.save(buffer, format=image_format,
+                         **SAVE_OPTIONS[image_format])
+            storage.save(
+                missing[width, extension], ContentFile(buffer.getvalue())
+            )
+
+
+def delete_variants(image_name, storage=default_storage):
+    for width in VARIANT_WIDTHS:
+        for extension in ('jpg', 'webp'):
+            storage.delete(variant_name(image_name, width, extension))
+
+
+def srcset(image_name, extension, storage=default_storage):
+    """Значение атрибута srcset; URL строятся без обращения к файлам."""
+    return ', '.join(
+        f'{storage.url(variant_name(image_name, width, extension))} {width}w'
+        for width in VARIANT_WIDTHS
+    )
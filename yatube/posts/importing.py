@@ -0,0 +1,277 @@
+"""Массовая загрузка пользователей, групп, постов, комментариев и подписок.
+
+Записи читаются из NDJSON или CSV и пишутся bulk_create пачками, по одной
+транзакции на файл. Внешние ключи разрешаются через словари в памяти:
+пользователи — по username, группы — по id из файла групп, slug или id
+уже существующей группы (так ссылается на группы export_ndjson), посты —
+по id из файла постов. Даты auto_now и auto_now_add bulk_create
+перезаписывает, поэтому даты из файла возвращаются следом UPDATE по id.
+
+Сигналы при загрузке не срабатывают. Importer запоминает созданные записи
+и затронутых пользователей и посты, и по ним команда import_data
+достраивает ленты, счетчики и поисковый индекс.
+"""
+import csv
+import json
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .bulk import assign_pks
+from .models import Comment, Follow, Group, Post
+from .timeline import batches
+
+User = get_user_model()
+
+IMPORT_BATCH_SIZE = 1000
+# Порядок загрузки: каждый вид записей ссылается только на предыдущие.
+RECORD_TYPES = ('user', 'group', 'follow', 'post', 'comment')
+
+
+class SkipRecord(Exception):
+    """Запись пропускается: нет обязательного поля или связанного объекта."""
+
+
+def read_records(path, record_type):
+    """Записи из файла: CSV с заголовком или NDJSON.
+
+    Строки выгрузки export_ndjson ({"type": ..., "data": ...}) тоже
+    понимаются: берутся только записи типа record_type.
+    """
+    if path.endswith('.csv'):
+        with open(path, newline='', encoding='utf-8') as stream:
+            for row in csv.DictReader(stream):
+                yield {key: value or None for key, value in row.items()}
+        return
+    with open(path, encoding='utf-8') as stream:
+        for line in stream:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if 'type' in record:
+                if record['type'] != record_type:
+                    continue
+                record = record['data']
+            yield record
+
+
+def auto_timestamps(model):
+    """Поля дат, которые bulk_create заполняет текущим временем."""
+    return [
+        field for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False)
+        or getattr(field, 'auto_now_add', False)
+    ]
+
+
+def parse_date(value, default):
+    if not value:
+        return default
+    try:
+        date = parse_datetime(value)
+    except ValueError:
+        # Формат верный, но значения вне диапазона: 2020-13-45.
+        date = None
+    if date is None:
+        raise SkipRecord(f'неверная дата {value}')
+    return date
+
+
+def image_name(value):
+    """Имя файла картинки из имени или ссылки, которую отдает API."""
+    if not value:
+        return ''
+    path = urlparse(value).path
+    if path.startswith(settings.MEDIA_URL):
+        return path[len(settings.MEDIA_URL):]
+    return value
+
+
+def required(record, field):
+    value = record.get(field)
+    if value in (None, ''):
+        raise SkipRecord(f'нет поля {field}')
+    return value
+
+
+class Importer:
+    """Загружает записи по видам; словари связей общие для всех файлов."""
+
+    def __init__(self, batch_size=IMPORT_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.now = timezone.now()
+        self.users = dict(User.objects.values_list('username', 'pk'))
+        self.group_slugs = dict(Group.objects.values_list('slug', 'pk'))
+        self.group_ids = {}
+        self.group_pks = set(Group.objects.values_list('pk', flat=True))
+        self.posts = {}
+        self.follows = None
+        # id созданных записей по видам.
+        self.created = {record_type: [] for record_type in RECORD_TYPES}
+        # У кого после загрузки пересчитать счетчики.
+        self.counted_users = set()
+        self.counted_posts = set()
+
+    def lookup(self, mapping, key, what):
+        pk = mapping.get(str(key)) if key is not None else None
+        if pk is None:
+            raise SkipRecord(f'нет {what} {key}')
+        return pk
+
+    def user_pk(self, username):
+        return self.lookup(self.users, username, 'пользователя')
+
+    def group_pk(self, key):
+        if key is None:
+            return None
+        key = str(key)
+        if key in self.group_ids:
+            return self.group_ids[key]
+        if key not in self.group_slugs and key.isdigit():
+            # Выгрузка export_ndjson ссылается на группы их id в базе.
+            if int(key) in self.group_pks:
+                return int(key)
+        return self.lookup(self.group_slugs, key, 'группы')
+
+    def build_user(self, record):
+        username = required(record, 'username')
+        if username in self.users:
+            raise SkipRecord(f'пользователь {username} уже есть')
+        user = User(
+            username=username,
+            email=record.get('email') or '',
+            first_name=record.get('first_name') or '',
+            last_name=record.get('last_name') or '',
+            # Ожидается уже захешированный пароль, без него вход закрыт.
+            password=record.get('password') or make_password(None),
+            date_joined=parse_date(record.get('date_joined'), self.now),
+        )
+        return user, [(self.users, username)]
+
+    def build_group(self, record):
+        slug = required(record, 'slug')
+        source_id = record.get('id')
+        if slug in self.group_slugs:
+            if source_id is not None:
+                self.group_ids[str(source_id)] = self.group_slugs[slug]
+            raise SkipRecord(f'группа {slug} уже есть')
+        group = Group(
+            title=required(record, 'title'),
+            slug=slug,
+            description=record.get('description') or '',
+        )
+        keys = [(self.group_slugs, slug)]
+        if source_id is not None:
+            keys.append((self.group_ids, str(source_id)))
+        return group, keys
+
+    def build_follow(self, record):
+        if self.follows is None:
+            self.follows = set(
+                Follow.objects.values_list('user_id', 'author_id')
+            )
+        user_id = self.user_pk(required(record, 'user'))
+        author_id = self.user_pk(
+            record.get('author') or required(record, 'following')
+        )
+        if user_id == author_id or (user_id, author_id) in self.follows:
+            raise SkipRecord('подписка на себя или повтор')
+        self.follows.add((user_id, author_id))
+        self.counted_users.update((user_id, author_id))
+        return Follow(user_id=user_id, author_id=author_id), []
+
+    def build_post(self, record):
+        pub_date = parse_date(record.get('pub_date'), self.now)
+        post = Post(
+            text=required(record, 'text'),
+            author_id=self.user_pk(required(record, 'author')),
+            group_id=self.group_pk(record.get('group')),
+            image=image_name(record.get('image')),
+            pub_date=pub_date,
+            updated=parse_date(record.get('updated'), pub_date),
+        )
+        self.counted_users.add(post.author_id)
+        source_id = record.get('id')
+        if source_id is None:
+            return post, []
+        return post, [(self.posts, str(source_id))]
+
+    def build_comment(self, record):
+        created = parse_date(record.get('created'), self.now)
+        comment = Comment(
+            post_id=self.lookup(self.posts, required(record, 'post'), 'поста'),
+            author_id=self.user_pk(required(record, 'author')),
+            text=required(record, 'text'),
+            created=created,
+            updated=parse_date(record.get('updated'), created),
+        )
+        self.counted_posts.add(comment.post_id)
+        return comment, []
+
+    def remember(self, objs, keys):
+        """Заносит id созданных объектов в словари связей."""
+        for obj, obj_keys in zip(objs, keys):
+            for mapping, key in obj_keys:
+                mapping[key] = obj.pk
+
+    def insert(self, objs):
+        """bulk_create с id и датами из файла."""
+        model = type(objs[0])
+        fields = auto_timestamps(model)
+        dates = [
+            [getattr(obj, field.attname) for field in fields] for obj in objs
+        ]
+        model.objects.bulk_create(objs)
+        assign_pks(model, objs)
+        if not fields:
+            return
+        for obj, values in zip(objs, dates):
+            for field, value in zip(fields, values):
+                setattr(obj, field.attname, value)
+        # Один UPDATE по id через executemany: bulk_update строит CASE на
+        # каждую строку и медленнее самой вставки.
+        quote = connection.ops.quote_name
+        columns = ', '.join(f'{quote(field.column)} = %s' for field in fields)
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'UPDATE {quote(model._meta.db_table)} SET {columns} '
+                f'WHERE {quote(model._meta.pk.column)} = %s',
+                [
+                    [field.get_db_prep_value(value, connection)
+                     for field, value in zip(fields, values)] + [obj.pk]
+                    for obj, values in zip(objs, dates)
+                ]
+            )
+
+    def load(self, record_type, records, on_skip=None):
+        """Загружает записи одного вида, возвращает (создано, пропущено)."""
+        build = getattr(self, f'build_{record_type}')
+        created = skipped = 0
+        with transaction.atomic():
+            for batch in batches(records, self.batch_size):
+                objs, keys = [], []
+                for record in batch:
+                    try:
+                        obj, obj_keys = build(record)
+                    except SkipRecord as error:
+                        skipped += 1
+                        if on_skip:
+                            on_skip(record_type, record, error)
+                        continue
+                    # До вставки ключ занят: повтор в файле пропускается.
+                    for mapping, key in obj_keys:
+                        mapping[key] = None
+                    objs.append(obj)
+                    keys.append(obj_keys)
+                if not objs:
+                    continue
+                self.insert(objs)
+                self.remember(objs, keys)
+                self.created[record_type].extend(obj.pk for obj in objs)
+                created += len(objs)
+        return created, skipped
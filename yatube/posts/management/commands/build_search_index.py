@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.search import INDEX_BATCH_SIZE, fts_available, rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Заново строит полнотекстовый индекс FTS5 по всем постам.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=INDEX_BATCH_SIZE,
+            help='Сколько постов вставлять в индекс за раз.'
+        )
+
+    def handle(self, *args, batch_size, **options):
+        if not fts_available():
+            raise CommandError('Полнотекстовый индекс есть только на SQLite.')
+        indexed = rebuild_index(batch_size)
+        self.stdout.write(f'Проиндексировано постов: {indexed}')
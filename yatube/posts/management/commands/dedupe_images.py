@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from posts.caching import bump_generation
+from posts.models import Post
+from posts.storage import post_images
+from posts.thumbnails import delete_unreferenced
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит картинки, загруженные до хранения по содержимому, под '
+        'имена из sha256: одинаковые файлы сливаются в один. После команды '
+        'стоит запустить pregenerate_thumbnails.'
+    )
+
+    def handle(self, *args, **options):
+        image_names = list(
+            Post.objects.exclude(image='').order_by().values_list(
+                'image', flat=True
+            ).distinct()
+        )
+        moved = freed = 0
+        for image_name in image_names:
+            if not post_images.exists(image_name):
+                self.stderr.write(f'Нет файла {image_name}')
+                continue
+            with post_images.open(image_name) as content:
+                new_name = post_images.content_name(image_name, content)
+                if new_name == image_name:
+                    continue
+                size = post_images.size(image_name)
+                if post_images.exists(new_name):
+                    freed += size
+                else:
+                    new_name = post_images.save(image_name, content)
+            # updated меняет ключи кэша карточек и представлений API.
+            Post.objects.filter(image=image_name).update(
+                image=new_name, image_variants=False, updated=timezone.now()
+            )
+            delete_unreferenced(image_name)
+            moved += 1
+        bump_generation()
+        self.stdout.write(
+            f'Перенесено картинок: {moved}, освобождено байт: {freed}'
+        )
@@ -0,0 +1,84 @@
+import time
+
+from django.core.management.base import CommandError
+
+from posts.importing import IMPORT_BATCH_SIZE, Importer
+from posts.synthetic import SyntheticData
+
+from .import_data import Command as ImportCommand
+
+
+class Command(ImportCommand):
+    help = (
+        'Заполняет базу синтетическими пользователями, группами, '
+        'подписками, постами с картинками и комментариями. Один --seed '
+        'дает один и тот же набор. Пишет через import_data: пачками '
+        'bulk_create с перестройкой лент, счетчиков и индекса в конце.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument(
+            '--follows-per-user', type=int, default=20,
+            help='Среднее число подписок пользователя.'
+        )
+        parser.add_argument(
+            '--image-ratio', type=float, default=0.1,
+            help='Доля постов с картинкой.'
+        )
+        parser.add_argument(
+            '--images', type=int, default=20,
+            help='Сколько разных картинок сгенерировать.'
+        )
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько дней распределить даты постов.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=IMPORT_BATCH_SIZE,
+            help='Сколько строк передавать в один bulk_create.'
+        )
+
+    def handle(self, *args, seed, batch_size, images, **options):
+        if batch_size <= 0:
+            raise CommandError('--batch-size должен быть больше нуля')
+        self.verbosity = options['verbosity']
+        data = SyntheticData(
+            seed=seed,
+            users=options['users'],
+            groups=options['groups'],
+            posts=options['posts'],
+            comments=options['comments'],
+            follows_per_user=options['follows_per_user'],
+            image_ratio=options['image_ratio'],
+            images=images if options['image_ratio'] > 0 else 0,
+            days=options['days'],
+        )
+        importer = Importer(batch_size)
+        started = time.perf_counter()
+        data.images()
+        self.stdout.write(
+            f'Картинок: {len(data.image_names)} за '
+            f'{time.perf_counter() - started:.1f} с'
+        )
+        total = 0
+        steps = (
+            ('user', data.users),
+            ('group', data.groups),
+            ('follow', data.follows),
+            ('post', data.posts),
+            ('comment', data.comments),
+        )
+        for record_type, records in steps:
+            start = time.perf_counter()
+            created, skipped = importer.load(
+                record_type, records(), on_skip=self.report_skip
+            )
+            self.report(record_type, created, skipped, start)
+            total += created
+        self.rebuild(importer)
+        self.report('всего', total, None, started)
@@ -0,0 +1,116 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import counters, timeline
+from posts.caching import bump_generation
+from posts.importing import (IMPORT_BATCH_SIZE, RECORD_TYPES, Importer,
+                             read_records)
+from posts.search import fts_available, index_posts, rebuild_index
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает пользователей, группы, подписки, посты и комментарии из '
+        'NDJSON или CSV пачками bulk_create, по транзакции на файл. После '
+        'загрузки достраивает ленты, счетчики и поисковый индекс для '
+        'загруженных записей.'
+    )
+
+    def add_arguments(self, parser):
+        for record_type in RECORD_TYPES:
+            parser.add_argument(
+                f'--{record_type}s', metavar='FILE',
+                help=f'Файл с записями {record_type} (.ndjson или .csv).'
+            )
+        parser.add_argument(
+            '--batch-size', type=int, default=IMPORT_BATCH_SIZE,
+            help='Сколько строк передавать в один bulk_create.'
+        )
+        parser.add_argument(
+            '--skip-rebuild', action='store_true',
+            help='Не перестраивать ленты, счетчики и индекс после загрузки.'
+        )
+        parser.add_argument(
+            '--full-rebuild', action='store_true',
+            help='Перестроить ленты, счетчики и индекс всей базы, например '
+                 'после нескольких загрузок с --skip-rebuild.'
+        )
+
+    def handle(self, *args, batch_size, skip_rebuild, full_rebuild,
+               **options):
+        files = [
+            (record_type, options[f'{record_type}s'])
+            for record_type in RECORD_TYPES
+            if options[f'{record_type}s']
+        ]
+        if not files:
+            raise CommandError('Не указан ни один файл.')
+        if batch_size <= 0:
+            raise CommandError('--batch-size должен быть больше нуля')
+        self.verbosity = options['verbosity']
+        importer = Importer(batch_size)
+        started = time.perf_counter()
+        total = 0
+        for record_type, path in files:
+            start = time.perf_counter()
+            try:
+                created, skipped = importer.load(
+                    record_type,
+                    read_records(path, record_type),
+                    on_skip=self.report_skip,
+                )
+            except (OSError, ValueError) as error:
+                raise CommandError(f'{path}: {error}')
+            self.report(record_type, created, skipped, start)
+            total += created
+        if full_rebuild:
+            self.rebuild_all()
+        elif not skip_rebuild:
+            self.rebuild(importer)
+        self.report('всего', total, None, started)
+
+    def rebuild(self, importer):
+        """Ленты, счетчики и индекс только для загруженных записей."""
+        start = time.perf_counter()
+        posts = importer.created['post']
+        entries = timeline.add_entries(posts, importer.created['follow'])
+        counters.recount(
+            importer.counted_users.union(importer.created['user']),
+            post_ids=importer.counted_posts,
+        )
+        self.report_rebuild(entries, index_posts(posts), start)
+
+    def rebuild_all(self):
+        start = time.perf_counter()
+        entries = timeline.rebuild()
+        counters.recount(User.objects.values_list('pk', flat=True))
+        indexed = rebuild_index() if fts_available() else 0
+        self.report_rebuild(entries, indexed, start)
+
+    def report_rebuild(self, entries, indexed, start):
+        bump_generation()
+        self.stdout.write(f'Записей в лентах: {entries}')
+        if fts_available():
+            self.stdout.write(f'Проиндексировано постов: {indexed}')
+        self.stdout.write(
+            f'Перестроено за {time.perf_counter() - start:.1f} с'
+        )
+
+    def report(self, record_type, created, skipped, start):
+        elapsed = time.perf_counter() - start
+        rate = created / elapsed if elapsed else 0
+        line = (
+            f'{record_type}: {created} строк за {elapsed:.1f} с '
+            f'({rate:.0f} строк/с)'
+        )
+        if skipped is not None:
+            line += f', пропущено: {skipped}'
+        self.stdout.write(line)
+
+    def report_skip(self, record_type, record, error):
+        if self.verbosity > 1:
+            self.stderr.write(f'{record_type} пропущен: {error}: {record}')
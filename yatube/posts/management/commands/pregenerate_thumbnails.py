@@ -0,0 +1,46 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts.models import Post
+from posts.thumbnails import process_image
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит миниатюры всех размеров и версии для srcset картинок '
+        'существующих постов параллельно в нескольких процессах.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Число процессов, по умолчанию — по числу ядер.'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=20,
+            help='Сколько картинок отдавать процессу за раз.'
+        )
+
+    def handle(self, *args, workers, chunk_size, **options):
+        image_names = list(
+            Post.objects.exclude(image='').order_by().values_list(
+                'image', flat=True
+            ).distinct()
+        )
+        # Дочерние процессы открывают свои соединения с БД.
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=django.setup
+        ) as executor:
+            for done, _ in enumerate(
+                executor.map(
+                    process_image, image_names, chunksize=chunk_size
+                ),
+                start=1
+            ):
+                if done % 100 == 0:
+                    self.stdout.write(f'Готово {done} из {len(image_names)}')
+        self.stdout.write(f'Обработано картинок: {len(image_names)}')
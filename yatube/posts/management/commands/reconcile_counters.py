@@ -0,0 +1,50 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from posts.counters import reconcile_posts, reconcile_users
+from posts.models import Post
+
+User = get_user_model()
+
+
+def pk_chunks(queryset, size):
+    """Первичные ключи пачками по size без OFFSET."""
+    last_pk = 0
+    while True:
+        chunk = list(
+            queryset.filter(pk__gt=last_pk).order_by('pk').values_list(
+                'pk', flat=True
+            )[:size]
+        )
+        if not chunk:
+            return
+        yield chunk
+        last_pk = chunk[-1]
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает денормализованные счетчики комментариев, постов '
+        'и подписок. Каждая пачка правится в своей короткой транзакции, '
+        'поэтому таблицы надолго не блокируются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько строк проверять за одну транзакцию.'
+        )
+
+    def handle(self, *args, batch_size, **options):
+        fixed_posts = sum(
+            reconcile_posts(chunk)
+            for chunk in pk_chunks(Post.objects.all(), batch_size)
+        )
+        fixed_users = sum(
+            reconcile_users(chunk)
+            for chunk in pk_chunks(User.objects.all(), batch_size)
+        )
+        self.stdout.write(
+            f'Исправлено постов: {fixed_posts}, '
+            f'пользователей: {fixed_users}'
+        )
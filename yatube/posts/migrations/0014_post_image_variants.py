@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-18 01:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_post_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_variants',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Есть версии картинки'),
+        ),
+    ]
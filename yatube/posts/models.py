@@ -1,6 +1,9 @@
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from .images import WEBP_SUPPORTED, srcset, validate_image
+from .storage import post_images
+
 
 User = get_user_model()
 
@@ -22,6 +25,13 @@ class Group(models.Model):
         verbose_name_plural = 'Группы'
 
 
+class PostQuerySet(models.QuerySet):
+    def feed(self):
+        """Посты для карточек лент: автор и группа выбираются одним
+        запросом, число комментариев хранится в comment_count."""
+        return self.select_related('author', 'group')
+
+
 class Post(models.Model):
     CONST = 15
     text = models.TextField(
@@ -51,15 +61,65 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=post_images,
+        validators=[validate_image],
         blank=True,
+        # По имени файла считаются ссылающиеся на него посты.
+        db_index=True,
         help_text='Загрузите изображение',
     )
+    # Версии картинки для srcset строятся в фоне после загрузки.
+    image_variants = models.BooleanField(
+        'Есть версии картинки',
+        default=False,
+        editable=False
+    )
+    updated = models.DateTimeField('Дата изменения', auto_now=True)
+    # Счетчик ведется в posts.counters через F()-выражения.
+    comment_count = models.IntegerField(
+        'Комментариев',
+        default=0,
+        editable=False
+    )
+
+    objects = PostQuerySet.as_manager()
+    COUNTER_FIELDS = ('comment_count',)
 
     def __str__(self):
         return self.text[:Post.CONST]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Картинка на момент чтения: если ее заменят, файл освобождается.
+        instance._loaded_image = instance.__dict__.get('image')
+        return instance
+
+    def image_srcset(self):
+        return srcset(self.image.name, 'jpg')
+
+    def image_webp_srcset(self):
+        return srcset(self.image.name, 'webp') if WEBP_SUPPORTED else ''
+
+    def save(self, *args, **kwargs):
+        # Не затираем счетчики значением, прочитанным до редактирования.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
     class Meta:
         ordering = ('-pub_date',)
+        # Ключ курсорной паджинации лент: (pub_date, id).
+        indexes = [
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='post_pub_date_id_idx'
+            ),
+        ]
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
 
@@ -80,6 +140,7 @@ class Comment(models.Model):
         help_text='Добавьте комментарий'
     )
     created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField('Дата изменения', auto_now=True)
 
     class Meta:
         verbose_name = 'Комментарий'
@@ -107,3 +168,65 @@ class Follow(models.Model):
 
     def __str__(self):
         return self.author
+
+
+class UserStats(models.Model):
+    """Денормализованные счетчики пользователя."""
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE,
+        related_name='stats',
+        verbose_name='Пользователь',
+    )
+    posts_count = models.IntegerField('Постов', default=0)
+    followers_count = models.IntegerField('Подписчиков', default=0)
+    following_count = models.IntegerField('Подписок', default=0)
+
+    class Meta:
+        verbose_name = 'Счетчики пользователя'
+        verbose_name_plural = 'Счетчики пользователей'
+
+    def __str__(self):
+        return str(self.user)
+
+
+class TimelineEntry(models.Model):
+    """Материализованная лента подписок: пост автора у его подписчика."""
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Подписчик',
+    )
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост',
+    )
+    author = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'post'),
+                name='unique_timeline_entry'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=('user', '-pub_date', '-post'),
+                name='timeline_user_pub_date_idx'
+            ),
+            models.Index(
+                fields=('user', 'author'),
+                name='timeline_user_author_idx'
+            ),
+        ]
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+
+    def __str__(self):
+        return f'{self.user} <- {self.post}'
@@ -0,0 +1,134 @@
+import base64
+import binascii
+import json
+
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.http import Http404
+from django.utils.dateparse import parse_datetime
+
+CURSOR_PARAM = 'cursor'
+PAGE_PARAM = 'page'
+# Старые ссылки ?page=N обслуживаются через OFFSET только до этой глубины,
+# дальше листать можно только курсорами, а ?page=N отвечает 404.
+MAX_OFFSET_PAGE = 50
+
+
+def encode_cursor(direction, pub_date, pk):
+    """Непрозрачный токен курсора: направление и ключ (pub_date, id)."""
+    payload = json.dumps([direction, pub_date.isoformat(), pk])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Разбирает токен курсора, для испорченного токена возвращает None."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        direction, pub_date, pk = json.loads(
+            base64.urlsafe_b64decode(padded.encode())
+        )
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (binascii.Error, TypeError, ValueError, UnicodeError):
+        return None
+    if direction not in ('next', 'prev') or pub_date is None:
+        return None
+    return direction, pub_date, pk
+
+
+class KeysetPaginator(Paginator):
+    """Паджинатор по ключу (pub_date, id) без OFFSET и COUNT(*).
+
+    Каждая страница выбирается одним запросом на per_page + 1 строк:
+    лишняя строка говорит о наличии следующей страницы. Номер страницы и
+    число страниц вычисляются относительно текущей, поэтому шаблон работает
+    только со ссылками has_previous/has_next и курсорами next_cursor и
+    previous_cursor.
+    """
+
+    def __init__(self, object_list, per_page,
+                 date_field='pub_date', id_field='id', **kwargs):
+        self.date_field = date_field
+        self.id_field = id_field
+        super().__init__(
+            object_list.order_by(f'-{date_field}', f'-{id_field}'),
+            per_page,
+            **kwargs
+        )
+
+    def get_page(self, number=None, cursor=None):
+        """Страница по курсору, а без него — по старому номеру страницы."""
+        if cursor:
+            decoded = decode_cursor(cursor)
+            if decoded is not None:
+                return self.cursor_page(*decoded)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            number = 1
+        if number > MAX_OFFSET_PAGE:
+            # Первая страница вместо глубокой выглядела бы как верный ответ.
+            raise Http404(
+                f'Страницы дальше {MAX_OFFSET_PAGE} доступны только по курсору'
+            )
+        return self.offset_page(max(number, 1))
+
+    def offset_page(self, number):
+        """Неглубокая страница по номеру: OFFSET без подсчета строк."""
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            # Пустая страница за концом ленты: ссылаться с нее некуда.
+            raise Http404(f'Нет страницы {number}')
+        has_next = len(rows) > self.per_page
+        return self.build_page(rows[:self.per_page], number > 1, has_next)
+
+    def cursor_page(self, direction, pub_date, pk):
+        """Страница, соседняя со строкой (pub_date, pk)."""
+        date_field, id_field = self.date_field, self.id_field
+        if direction == 'next':
+            rows = self.object_list.filter(
+                Q(**{f'{date_field}__lt': pub_date})
+                | Q(**{date_field: pub_date, f'{id_field}__lt': pk})
+            )
+        else:
+            rows = self.object_list.filter(
+                Q(**{f'{date_field}__gt': pub_date})
+                | Q(**{date_field: pub_date, f'{id_field}__gt': pk})
+            ).order_by(date_field, id_field)
+        rows = list(rows[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == 'next':
+            return self.build_page(rows, True, has_more)
+        rows.reverse()
+        return self.build_page(rows, has_more, True)
+
+    def build_page(self, rows, has_previous, has_next):
+        # Page.has_next()/has_previous() сравнивают номер с num_pages,
+        # поэтому задаем их так, чтобы не требовался COUNT(*).
+        number = 2 if has_previous else 1
+        self.num_pages = number + 1 if has_next else number
+        page = self._get_page(rows, number, self)
+        page.next_cursor = page.previous_cursor = None
+        if rows and has_next:
+            page.next_cursor = self.cursor_for('next', rows[-1])
+        if rows and has_previous:
+            page.previous_cursor = self.cursor_for('prev', rows[0])
+        return page
+
+    def cursor_for(self, direction, obj):
+        return encode_cursor(
+            direction,
+            getattr(obj, self.date_field),
+            getattr(obj, self.id_field)
+        )
+
+
+def paginate(request, object_list, per_page, **kwargs):
+    """Страница ленты для запроса с параметрами ?cursor= или ?page=."""
+    paginator = KeysetPaginator(object_list, per_page, **kwargs)
+    return paginator.get_page(
+        request.GET.get(PAGE_PARAM),
+        cursor=request.GET.get(CURSOR_PARAM)
+    )
@@ -0,0 +1,159 @@
+"""Полнотекстовый поиск по постам на SQLite FTS5.
+
+Текст постов копируется в виртуальную таблицу posts_post_fts с rowid,
+равным id поста. Таблицу синхронизируют сигналы сохранения и удаления
+Post, а команда build_search_index перестраивает ее целиком. На других
+СУБД поиск деградирует до text__icontains.
+"""
+import re
+
+from django.db import connection, transaction
+
+from .models import Post
+
+FTS_TABLE = 'posts_post_fts'
+INDEX_BATCH_SIZE = 1000
+
+
+def fts_available():
+    return connection.vendor == 'sqlite'
+
+
+def build_match_query(query):
+    """Безопасный запрос MATCH: каждое слово ищется по префиксу."""
+    words = re.findall(r'\w+', query)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def index_post(post):
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post.id])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, text) VALUES (%s, %s)',
+            [post.id, post.text]
+        )
+
+
+def index_new_posts(posts):
+    """Добавляет в индекс только что созданные посты одним executemany."""
+    if not fts_available() or not posts:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, text) VALUES (%s, %s)',
+            [(post.id, post.text) for post in posts]
+        )
+
+
+def index_posts(post_ids, batch_size=INDEX_BATCH_SIZE):
+    """Добавляет в индекс новые посты по id пачками, возвращает их число.
+
+    Для постов, загруженных мимо сигналов.
+    """
+    if not fts_available():
+        return 0
+    post_ids = list(post_ids)
+    indexed = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        for start in range(0, len(post_ids), batch_size):
+            rows = list(Post.objects.filter(
+                pk__in=post_ids[start:start + batch_size]
+            ).values_list('pk', 'text'))
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, text) VALUES (%s, %s)', rows
+            )
+            indexed += len(rows)
+    return indexed
+
+
+def unindex_post(post_id):
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id])
+
+
+def rebuild_index(batch_size=INDEX_BATCH_SIZE):
+    """Заполняет индекс заново пачками, возвращает число постов."""
+    indexed = 0
+    last_pk = 0
+    # Читатели видят старый индекс, пока новый не построен целиком.
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        while True:
+            rows = list(
+                Post.objects.filter(pk__gt=last_pk).order_by('pk').values_list(
+                    'pk', 'text'
+                )[:batch_size]
+            )
+            if not rows:
+                return indexed
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, text) VALUES (%s, %s)', rows
+            )
+            indexed += len(rows)
+            last_pk = rows[-1][0]
+
+
+class SearchResults:
+    """Ранжированные результаты поиска для Paginator и пагинации DRF.
+
+    count() и срезы выполняют по одному запросу к FTS5, посты среза
+    выбираются одним запросом feed() в порядке релевантности.
+    """
+
+    def __init__(self, query):
+        self.match = build_match_query(query)
+        self.prefetch_lookups = ()
+
+    def prefetch_related(self, *lookups):
+        """Как у QuerySet: связи подгружаются для каждого среза."""
+        clone = SearchResults.__new__(SearchResults)
+        clone.match = self.match
+        clone.prefetch_lookups = self.prefetch_lookups + lookups
+        return clone
+
+    def count(self):
+        if not self.match:
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT COUNT(*) FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s',
+                [self.match]
+            )
+            return cursor.fetchone()[0]
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start = index.start or 0
+        if not self.match or (index.stop is not None and index.stop <= start):
+            return []
+        limit = -1 if index.stop is None else index.stop - start
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s ORDER BY rank '
+                f'LIMIT %s OFFSET %s',
+                [self.match, limit, start]
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+        posts = Post.objects.feed().prefetch_related(
+            *self.prefetch_lookups
+        ).in_bulk(ids)
+        return [posts[post_id] for post_id in ids if post_id in posts]
+
+
+def search_posts(query):
+    if fts_available():
+        return SearchResults(query)
+    return Post.objects.feed().filter(text__icontains=query)
@@ -0,0 +1,87 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import counters, search, timeline
+from .thumbnails import release_image
+from .caching import bump_generation
+from .models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    bump_generation()
+    search.index_post(instance)
+    loaded_image = getattr(instance, '_loaded_image', None)
+    if loaded_image and loaded_image != instance.image.name:
+        release_image(loaded_image)
+    instance._loaded_image = instance.image.name
+    if created:
+        timeline.fan_out_post(instance)
+        counters.change_user_counter(instance.author_id, 'posts_count', 1)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    bump_generation()
+    search.unindex_post(instance.id)
+    release_image(instance.image.name)
+    counters.change_user_counter(instance.author_id, 'posts_count', -1)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    bump_generation()
+    if created:
+        counters.change_comment_count(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    bump_generation()
+    counters.change_comment_count(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, **kwargs):
+    bump_generation()
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, **kwargs):
+    if created:
+        timeline.backfill(instance.user_id, instance.author_id)
+        counters.change_user_counter(
+            instance.author_id, 'followers_count', 1
+        )
+        counters.change_user_counter(instance.user_id, 'following_count', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    timeline.trim(instance.user_id, instance.author_id)
+    counters.change_user_counter(instance.author_id, 'followers_count', -1)
+    counters.change_user_counter(instance.user_id, 'following_count', -1)
+
+
+@receiver(pre_save, sender=User)
+def user_renaming(sender, instance, update_fields=None, **kwargs):
+    # Вход обновляет только last_login: лишнего запроса не делаем.
+    if instance.pk is None or (
+            update_fields is not None and 'username' not in update_fields):
+        return
+    old = User.objects.filter(pk=instance.pk).values_list(
+        'username', flat=True
+    ).first()
+    instance._renamed = old is not None and old != instance.username
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, **kwargs):
+    # Имя автора показано в карточках и входит в ETag лент.
+    if getattr(instance, '_renamed', False):
+        instance._renamed = False
+        bump_generation()
@@ -0,0 +1,81 @@
+"""Хранилище картинок постов с адресацией по содержимому.
+
+Файл сохраняется под именем posts/<2 символа>/<sha256><.расширение>.
+Повторная загрузка той же картинки (репост, пересохранение формы
+редактирования) не пишет новый файл, а получает имя уже существующего,
+поэтому миниатюры sorl и версии для srcset для него тоже уже готовы.
+
+Ссылками на файл служат строки Post с таким image (поле индексировано).
+Когда последняя из них удалена или получила другую картинку,
+posts.thumbnails.release_image удаляет файл вместе с миниатюрами.
+
+Пост, получивший имя уже сохраненного файла, до коммита своей транзакции
+не виден другим запросам. Поэтому повторное использование обновляет время
+изменения файла, а удаление откладывается, пока файл использовался
+последние REUSE_GRACE секунд. Проверка и удаление, как и повторное
+использование, идут под блокировкой names_lock.
+"""
+import fcntl
+import hashlib
+import os
+import posixpath
+import time
+from contextlib import contextmanager
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import FileSystemStorage
+
+# Дольше любой транзакции, создающей пост с картинкой.
+REUSE_GRACE = 10 * 60
+LOCK_NAME = '.posts-images.lock'
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def content_name(self, name, content):
+        directory = posixpath.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        digest = content_hash(content)
+        return posixpath.join(directory, digest[:2], digest + extension)
+
+    @contextmanager
+    def names_lock(self):
+        """Блокировка на все процессы хоста: повторное использование файла
+        не пересекается с проверкой перед его удалением."""
+        os.makedirs(self.location, exist_ok=True)
+        with open(os.path.join(self.location, LOCK_NAME), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def reused_recently(self, name):
+        """Файл сохранен или использован повторно за REUSE_GRACE."""
+        try:
+            modified = os.path.getmtime(self.path(name))
+        except (FileNotFoundError, SuspiciousFileOperation):
+            # Имя вне хранилища (старые данные) не могло быть выдано save().
+            return False
+        return time.time() - modified < REUSE_GRACE
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        name = self.content_name(name, content)
+        with self.names_lock():
+            if self.exists(name):
+                os.utime(self.path(name))
+                return name
+        # Если тот же файл параллельно пишет другой запрос, FileSystemStorage
+        # сохранит копию под свободным именем: дубль, но не ошибка.
+        return super().save(name, content, max_length)
+
+
+post_images = ContentAddressedStorage()
@@ -0,0 +1,167 @@
+"""Синтетические данные для нагрузочных замеров.
+
+Все случайные величины берутся из random.Random(seed) и Faker с тем же
+seed, поэтому один seed дает один и тот же набор данных. Записи выдаются
+в формате posts.importing и пишутся его Importer пачками bulk_create.
+
+Популярность и активность авторов распределены по Ципфу: немногие
+авторы собирают большинство подписчиков, немногие пишут большую часть
+постов. Это разные авторы: если бы самые читаемые писали и больше всех,
+ленты подписок росли бы как произведение двух хвостов. Комментарии тоже
+сосредоточены на части постов.
+"""
+import io
+import random
+from array import array
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from faker import Faker
+from PIL import Image, ImageDraw
+
+from .storage import post_images
+
+# Даты отсчитываются назад от фиксированного момента, а не от now():
+# иначе один seed давал бы разные данные в разные дни.
+ANCHOR = datetime(2026, 1, 1, tzinfo=timezone.utc)
+FOLLOW_ZIPF_EXPONENT = 1.1
+POST_ZIPF_EXPONENT = 0.8
+SENTENCE_POOL_SIZE = 2000
+IMAGE_SIZE = (1200, 800)
+
+
+def zipf_weights(count, exponent):
+    """Накопленные веса рангов 1..count для random.choices."""
+    return list(accumulate(
+        1 / (rank + 1) ** exponent for rank in range(count)
+    ))
+
+
+class SyntheticData:
+    def __init__(self, seed=1, users=1000, groups=20, posts=10000,
+                 comments=20000, follows_per_user=20, image_ratio=0.1,
+                 images=20, days=365):
+        self.rng = random.Random(seed)
+        self.fake = Faker('ru_RU')
+        self.fake.seed_instance(seed)
+        self.user_count = users
+        self.group_count = groups
+        self.post_count = posts
+        self.comment_count = comments
+        self.follows_per_user = follows_per_user
+        self.image_ratio = image_ratio
+        self.image_count = images
+        self.seconds = days * 24 * 60 * 60
+        self.usernames = [
+            f'{self.fake.user_name()}{number}' for number in range(users)
+        ]
+        self.popularity = zipf_weights(users, FOLLOW_ZIPF_EXPONENT)
+        self.activity = zipf_weights(users, POST_ZIPF_EXPONENT)
+        self.writers = self.usernames[:]
+        self.rng.shuffle(self.writers)
+        self.sentences = [
+            self.fake.sentence(nb_words=12)
+            for _ in range(SENTENCE_POOL_SIZE)
+        ]
+        # Возраст каждого поста в секундах: комментарии пишутся позже.
+        self.post_ages = array('d')
+        self.image_names = []
+
+    def date(self, age):
+        return (ANCHOR - timedelta(seconds=age)).isoformat()
+
+    def popular_authors(self, count):
+        return self.rng.choices(
+            self.usernames, cum_weights=self.popularity, k=count
+        )
+
+    def users(self):
+        for username in self.usernames:
+            yield {
+                'username': username,
+                'email': f'{username}@example.com',
+                'date_joined': self.date(self.seconds),
+            }
+
+    def groups(self):
+        for number in range(self.group_count):
+            yield {
+                'id': number,
+                'title': self.fake.catch_phrase()[:200],
+                'slug': f'group-{number}',
+                'description': self.fake.paragraph(),
+            }
+
+    def follows(self):
+        """У каждого пользователя в среднем follows_per_user подписок,
+        выбранных по популярности авторов."""
+        if self.user_count < 2:
+            return
+        for username in self.usernames:
+            count = int(self.rng.expovariate(1 / self.follows_per_user))
+            count = min(count, self.user_count - 1)
+            # dict, а не set: порядок строк в set меняется от запуска к
+            # запуску вместе с PYTHONHASHSEED.
+            for author in dict.fromkeys(self.popular_authors(count)):
+                if author != username:
+                    yield {'user': username, 'author': author}
+
+    def images(self):
+        """Картинки-заглушки: фон и несколько фигур случайных цветов."""
+        for _ in range(self.image_count):
+            image = Image.new('RGB', IMAGE_SIZE, self.color())
+            draw = ImageDraw.Draw(image)
+            for _ in range(self.rng.randint(3, 8)):
+                x, y = (self.rng.randrange(size) for size in IMAGE_SIZE)
+                width, height = (
+                    self.rng.randint(50, size // 2) for size in IMAGE_SIZE
+                )
+                draw.ellipse((x, y, x + width, y + height), self.color())
+            content = io.BytesIO()
+            image.save(content, 'JPEG', quality=85)
+            self.image_names.append(post_images.save(
+                'posts/synthetic.jpg', ContentFile(content.getvalue())
+            ))
+        return self.image_names
+
+    def color(self):
+        return tuple(self.rng.randrange(256) for _ in range(3))
+
+    def posts(self):
+        if not self.usernames:
+            return
+        authors = self.rng.choices(
+            self.writers, cum_weights=self.activity, k=self.post_count
+        )
+        for number, author in enumerate(authors):
+            age = self.rng.uniform(0, self.seconds)
+            self.post_ages.append(age)
+            record = {
+                'id': number,
+                'author': author,
+                'text': ' '.join(
+                    self.rng.choices(self.sentences, k=self.rng.randint(1, 6))
+                ),
+                'pub_date': self.date(age),
+            }
+            if self.group_count and self.rng.random() < 0.6:
+                record['group'] = self.rng.randrange(self.group_count)
+            if self.image_names and self.rng.random() < self.image_ratio:
+                record['image'] = self.rng.choice(self.image_names)
+            yield record
+
+    def comments(self):
+        """Комментарии к уже выданным постам, чаще к первым из них."""
+        if not self.post_ages or not self.usernames:
+            return
+        for _ in range(self.comment_count):
+            post = int(len(self.post_ages) * self.rng.random() ** 3)
+            age = self.rng.uniform(0, self.post_ages[post])
+            yield {
+                'post': post,
+                'author': self.rng.choice(self.usernames),
+                'text': self.rng.choice(self.sentences),
+                'created': self.date(age),
+            }
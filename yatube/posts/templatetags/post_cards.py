@@ -0,0 +1,72 @@
+from django import template
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from sorl.thumbnail.templatetags.thumbnail import ThumbnailNode
+
+from posts.caching import CARD_CACHE_TIMEOUT, card_cache_key
+from posts.thumbnails import prefetch_thumbnails
+
+register = template.Library()
+
+# Место в закэшированной карточке, куда подставляется кнопка автора.
+EDIT_BUTTON_MARK = '<!-- edit-button -->'
+
+
+@register.simple_tag(takes_context=True)
+def prefetch_post_cards(context, posts):
+    """Читает карточки всех постов страницы одним get_many, а для
+    промахов одним обращением находит готовые миниатюры."""
+    keys = {card_cache_key(post): post for post in posts}
+    cards = cache.get_many(list(keys))
+    context['prefetched_cards'] = cards
+    context['prefetched_thumbnails'] = prefetch_thumbnails(
+        post for key, post in keys.items() if key not in cards
+    )
+    return ''
+
+
+@register.simple_tag(takes_context=True)
+def post_card(context, post):
+    """Карточка поста из общего кэша с кнопкой редактирования для автора."""
+    key = card_cache_key(post)
+    card = context.get('prefetched_cards', {}).get(key)
+    if card is None:
+        card = cache.get(key)
+    if card is None:
+        card = render_to_string('posts/includes/post_item.html', {
+            'post': post,
+            'prefetched_thumbnails': context.get('prefetched_thumbnails'),
+        })
+        cache.set(key, card, CARD_CACHE_TIMEOUT)
+    button = ''
+    user = context.get('user')
+    if user is not None and user.is_authenticated and (
+        user.pk == post.author_id
+    ):
+        button = render_to_string(
+            'posts/includes/post_edit_button.html', {'post': post}
+        )
+    return mark_safe(card.replace(EDIT_BUTTON_MARK, button, 1))
+
+
+class PrefetchedThumbnailNode(ThumbnailNode):
+    """{% thumbnail %}, сначала ищущий миниатюру среди найденных
+    prefetch_post_cards, и только потом в KV-store sorl."""
+
+    def _render(self, context):
+        prefetched = context.get('prefetched_thumbnails') or {}
+        file_ = self.file_.resolve(context)
+        thumbnail = prefetched.get(
+            (getattr(file_, 'name', None), self.geometry.resolve(context))
+        )
+        if thumbnail is None or not self.as_var:
+            return super()._render(context)
+        with context.push(**{self.as_var: thumbnail}):
+            return self.nodelist_file.render(context)
+
+
+@register.tag
+def prefetched_thumbnail(parser, token):
+    """Синтаксис как у {% thumbnail ... as im %}...{% endthumbnail %}."""
+    return PrefetchedThumbnailNode(parser, token)
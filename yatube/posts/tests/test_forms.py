@@ -1,14 +1,43 @@
+import shutil
+import tempfile
 from http import HTTPStatus
+from io import BytesIO
+from unittest import mock
 
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from PIL import Image
+from rest_framework.test import APIClient
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.images import ImageFile
 
+from ..images import (
+    MAX_IMAGE_SIDE, VARIANT_WIDTHS, normalize_upload, variant_formats,
+    variant_name
+)
 from ..models import Group, Post, Comment
+from ..storage import post_images
+from ..uploads import ImageUploadHandler
+from ..thumbnails import (
+    THUMBNAIL_SIZES, delete_unreferenced, generate_thumbnails,
+    prefetch_thumbnails, process_image, wait_for_pending
+)
 
 User = get_user_model()
 
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
 
 class PostFormTests(TestCase):
     @classmethod
@@ -172,3 +201,192 @@ class CommentFormTests(TestCase):
             )
         )
         self.assertEqual(CommentFormTests.comment.text, comment_data['text'])
+
+
+class TemporaryMediaMixin:
+    """Картинки тестов класса — во временном каталоге вне проекта."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_settings = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        wait_for_pending()
+        cls.media_settings.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+
+
+class ThumbnailTests(TemporaryMediaMixin, TestCase):
+
+    def setUp(self):
+        # Картинка теста всегда получает одно имя, а кэш KV-store sorl не
+        # откатывается вместе с транзакцией теста.
+        cache.clear()
+        user = User.objects.create_user(username='author')
+        self.post = Post.objects.create(
+            author=user,
+            text='text',
+            image=SimpleUploadedFile(
+                name='small.gif',
+                content=SMALL_GIF,
+                content_type='image/gif',
+            ),
+        )
+
+    def test_generate_thumbnails(self):
+        """Миниатюры всех размеров строятся заранее и попадают в KV-store."""
+        generate_thumbnails(self.post.image.name)
+        thumbnails = default.kvstore._get(
+            ImageFile(self.post.image).key, identity='thumbnails'
+        )
+        self.assertEqual(len(thumbnails), len(THUMBNAIL_SIZES))
+
+    def test_prefetch_thumbnails(self):
+        """Миниатюры страницы находятся одним запросом, потом из кэша."""
+        generate_thumbnails(self.post.image.name)
+        cache.clear()
+        with self.assertNumQueries(1):
+            prefetched = prefetch_thumbnails([self.post])
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                prefetch_thumbnails([self.post]).keys(), prefetched.keys()
+            )
+        geometry, options = THUMBNAIL_SIZES[0]
+        self.assertEqual(
+            prefetched[(self.post.image.name, geometry)].url,
+            get_thumbnail(self.post.image, geometry, **options).url
+        )
+
+    def test_normalize_upload(self):
+        """Картинка поворачивается по EXIF, теряет его и уменьшается."""
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: повернуть на 90°.
+        buffer = BytesIO()
+        Image.new('RGB', (3000, 100)).save(
+            buffer, 'JPEG', exif=exif.tobytes()
+        )
+        upload = SimpleUploadedFile('photo.jpg', buffer.getvalue())
+        image = Image.open(normalize_upload(upload))
+        self.assertEqual(image.size, (85, MAX_IMAGE_SIDE))
+        self.assertNotIn('exif', image.info)
+
+    def test_process_image(self):
+        """Версии для srcset записываются, карточка начинает их отдавать."""
+        process_image(self.post.image.name)
+        for width in VARIANT_WIDTHS:
+            for extension in variant_formats():
+                self.assertTrue(default_storage.exists(
+                    variant_name(self.post.image.name, width, extension)
+                ))
+        self.post.refresh_from_db()
+        self.assertTrue(self.post.image_variants)
+        response = self.client.get(
+            reverse('posts:post_detail', args=(self.post.id,))
+        )
+        self.assertContains(response, self.post.image_srcset())
+
+    @mock.patch('posts.storage.REUSE_GRACE', 0)
+    def test_same_image_stored_once(self):
+        """Одинаковые картинки хранятся одним файлом, пока на него есть
+        ссылки."""
+        repost = Post.objects.create(
+            author=self.post.author,
+            text='repost',
+            image=SimpleUploadedFile(
+                name='copy.gif',
+                content=SMALL_GIF,
+                content_type='image/gif',
+            ),
+        )
+        image_name = self.post.image.name
+        self.assertEqual(repost.image.name, image_name)
+        generate_thumbnails(image_name)
+        thumbnail = prefetch_thumbnails([repost])[(image_name, '960x339')]
+        self.post.delete()
+        delete_unreferenced(image_name)
+        self.assertTrue(post_images.exists(image_name))
+        repost.delete()
+        delete_unreferenced(image_name)
+        self.assertFalse(post_images.exists(image_name))
+        self.assertFalse(thumbnail.exists())
+
+    def test_recently_reused_image_is_not_deleted(self):
+        """Картинку, только что отданную новому посту (его транзакция
+        могла еще не завершиться), удаление откладывает."""
+        image_name = self.post.image.name
+        self.post.delete()
+        post_images.save('copy.gif', SimpleUploadedFile('copy.gif', SMALL_GIF))
+        with mock.patch('posts.thumbnails.retry_delete') as retry_delete:
+            delete_unreferenced(image_name)
+        self.assertTrue(post_images.exists(image_name))
+        retry_delete.assert_called_once_with(image_name)
+
+
+class ImageUploadValidationTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='uploader')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def post_image(self):
+        return self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={
+                'text': 'text',
+                'image': SimpleUploadedFile('small.gif', SMALL_GIF),
+            },
+        )
+
+    def test_too_many_pixels_rejected(self):
+        """Картинка с большим числом пикселей отклоняется по заголовку."""
+        with mock.patch('posts.images.MAX_IMAGE_PIXELS', 1), \
+                mock.patch('posts.images.normalize_upload') as normalize:
+            response = self.post_image()
+        self.assertFormError(
+            response, 'form', 'image', 'Картинка 2x1 слишком большая.'
+        )
+        normalize.assert_not_called()
+        self.assertFalse(Post.objects.exists())
+
+    def test_image_handler_only_on_image_views(self):
+        """Обрезающий обработчик загрузки стоит только там, где
+        загружают картинку поста."""
+        post = Post.objects.create(author=self.user, text='text')
+        api_client = APIClient()
+        api_client.force_authenticate(self.user)
+        requests = {
+            'post_create': (True, lambda: self.post_image()),
+            'api': (True, lambda: api_client.post(
+                '/api/v1/posts/',
+                {'text': 'text',
+                 'image': SimpleUploadedFile('small.gif', SMALL_GIF)},
+                format='multipart'
+            )),
+            'add_comment': (False, lambda: self.authorized_client.post(
+                reverse('posts:add_comment', args=(post.id,)),
+                {'text': 'c',
+                 'file': SimpleUploadedFile('small.gif', SMALL_GIF)},
+            )),
+        }
+        original = ImageUploadHandler.receive_data_chunk
+        for name, (expected, send) in requests.items():
+            with self.subTest(name=name), mock.patch.object(
+                ImageUploadHandler, 'receive_data_chunk', autospec=True,
+                side_effect=original
+            ) as receive:
+                send()
+                self.assertEqual(receive.called, expected)
+
+    def test_too_large_file_rejected(self):
+        """Файл больше лимита отклоняется с его настоящим размером."""
+        with mock.patch('posts.images.MAX_UPLOAD_SIZE', 10):
+            response = self.post_image()
+        image = response.context['form'].files['image']
+        self.assertEqual(image.size, len(SMALL_GIF))
+        self.assertFormError(response, 'form', 'image', 'Файл больше 0 МБ.')
+        self.assertFalse(Post.objects.exists())
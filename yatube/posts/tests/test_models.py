@@ -1,5 +1,14 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
 from django.test import TestCase
-from ..models import Group, Post, User, Comment, Follow
+from ..counters import count_user_stats, reconcile_users, user_stats
+from ..models import (Group, Post, User, Comment, Follow, TimelineEntry,
+                      UserStats)
 from django.contrib.auth import get_user_model
 
 
@@ -133,3 +142,243 @@ class FollowModelTest(TestCase):
         follow = FollowModelTest.follow
         verbose_user = follow._meta.get_field('user').verbose_name
         self.assertEqual(verbose_user, 'Подписчик')
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def test_counters_follow_writes(self):
+        """Счетчики меняются при создании и удалении записей."""
+        post = Post.objects.create(author=self.author, text='пост')
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='комментарий'
+        )
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        stats = UserStats.objects.get(user=self.author)
+        self.assertEqual(stats.posts_count, 1)
+        self.assertEqual(stats.followers_count, 1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.reader).following_count, 1
+        )
+        comment.delete()
+        follow.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 0)
+        stats.refresh_from_db()
+        self.assertEqual(stats.followers_count, 0)
+
+    def test_edit_keeps_comment_count(self):
+        """Сохранение отредактированного поста не затирает счетчик."""
+        post = Post.objects.create(author=self.author, text='пост')
+        Comment.objects.create(post=post, author=self.reader, text='к')
+        post.text = 'новый текст'
+        post.save()
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+
+    def test_reconcile_counters(self):
+        """Команда reconcile_counters чинит расхождение счетчиков."""
+        post = Post.objects.create(author=self.author, text='пост')
+        Comment.objects.create(post=post, author=self.reader, text='к')
+        Post.objects.filter(pk=post.pk).update(comment_count=7)
+        UserStats.objects.filter(user=self.author).update(posts_count=0)
+        call_command('reconcile_counters', batch_size=1, stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 1
+        )
+
+    def test_reconcile_during_concurrent_follow(self):
+        """Подписка, сохраненная посреди сверки, не учитывается дважды."""
+        user_stats(self.author)
+        UserStats.objects.filter(user=self.author).update(followers_count=5)
+
+        def follow_after_count(user_ids):
+            actual = count_user_stats(user_ids)
+            if not Follow.objects.exists():
+                Follow.objects.create(user=self.reader, author=self.author)
+            return actual
+
+        with mock.patch(
+            'posts.counters.count_user_stats', side_effect=follow_after_count
+        ):
+            self.assertEqual(reconcile_users([self.author.pk]), 1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).followers_count, 1
+        )
+
+
+class ImportDataTest(TestCase):
+    def setUp(self):
+        self.existing = User.objects.create_user(username='existing')
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w', encoding='utf-8') as stream:
+            stream.write(content)
+        return path
+
+    def ndjson(self, name, records):
+        return self.write(
+            name, ''.join(json.dumps(record) + '\n' for record in records)
+        )
+
+    def test_import_data(self):
+        """Записи загружаются со связями по ключам из файлов, после чего
+        перестраиваются ленты и счетчики."""
+        users = self.write(
+            'users.csv',
+            'username,email\nreader,r@example.com\nwriter,\nexisting,\n'
+        )
+        groups = self.ndjson('groups.ndjson', [
+            {'id': 70, 'title': 'Группа', 'slug': 'imported'},
+        ])
+        follows = self.write(
+            'follows.csv', 'user,author\nreader,writer\nreader,writer\n'
+        )
+        posts = self.ndjson('posts.ndjson', [
+            {'type': 'post', 'data': {
+                'id': 500, 'text': 'Старый пост', 'author': 'writer',
+                'group': 70, 'pub_date': '2020-01-02T03:04:05Z',
+                'image': '/media/posts/ab/old.jpg',
+            }},
+            {'type': 'comment', 'data': {
+                'post': 500, 'author': 'reader', 'text': 'Комментарий',
+            }},
+            {'type': 'cursor', 'cursor': '500'},
+            {'type': 'post', 'data': {'text': 'Без автора'}},
+        ])
+        out = StringIO()
+        call_command(
+            'import_data', users=users, groups=groups, follows=follows,
+            posts=posts, comments=posts, batch_size=1, stdout=out
+        )
+        writer = User.objects.get(username='writer')
+        reader = User.objects.get(username='reader')
+        self.assertEqual(reader.email, 'r@example.com')
+        self.assertFalse(writer.has_usable_password())
+        self.assertEqual(User.objects.count(), 3)
+        post = Post.objects.get()
+        self.assertEqual(post.author, writer)
+        self.assertEqual(post.group.slug, 'imported')
+        self.assertEqual(post.image.name, 'posts/ab/old.jpg')
+        self.assertEqual(post.pub_date.year, 2020)
+        self.assertEqual(post.updated, post.pub_date)
+        self.assertEqual(post.comments.get().author, reader)
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(Follow.objects.count(), 1)
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=reader, post=post).exists()
+        )
+        self.assertEqual(UserStats.objects.get(user=writer).posts_count, 1)
+        self.assertIn('пропущено: 1', out.getvalue())
+        self.assertIn('строк/с', out.getvalue())
+
+    def test_bad_dates_are_skipped(self):
+        """Записи с неверной датой пропускаются, остальные загружаются."""
+        posts = self.ndjson('posts.ndjson', [
+            {'id': 1, 'text': 'Верный', 'author': 'existing',
+             'pub_date': '2020-01-02T03:04:05Z'},
+            {'id': 2, 'text': 'Мусор', 'author': 'existing',
+             'pub_date': 'garbage'},
+            {'id': 3, 'text': 'Вне диапазона', 'author': 'existing',
+             'pub_date': '2020-13-45T00:00:00'},
+            {'id': 4, 'text': 'Без даты', 'author': 'existing'},
+        ])
+        comments = self.ndjson('comments.ndjson', [
+            {'post': 1, 'author': 'existing', 'text': 'Верный'},
+            {'post': 1, 'author': 'existing', 'text': 'Мусор',
+             'updated': 'garbage'},
+            {'post': 4, 'author': 'existing', 'text': 'Вне диапазона',
+             'created': '2021-02-30T00:00:00'},
+        ])
+        out = StringIO()
+        call_command(
+            'import_data', posts=posts, comments=comments, stdout=out
+        )
+        self.assertEqual(
+            set(Post.objects.values_list('text', flat=True)),
+            {'Верный', 'Без даты'}
+        )
+        self.assertEqual(
+            list(Comment.objects.values_list('text', flat=True)), ['Верный']
+        )
+        self.assertIn('post: 2 строк', out.getvalue())
+        self.assertIn('comment: 1 строк', out.getvalue())
+        self.assertEqual(out.getvalue().count('пропущено: 2'), 2)
+
+    def test_rebuild_scoped_to_imported(self):
+        """После загрузки пересчитывается только загруженное, всю базу
+        перестраивает --full-rebuild."""
+        other = Post.objects.create(author=self.existing, text='Старый')
+        Comment.objects.create(post=other, author=self.existing, text='Ок')
+        Post.objects.filter(pk=other.pk).update(comment_count=5)
+        posts = self.ndjson('posts.ndjson', [
+            {'id': 1, 'text': 'Новый', 'author': 'existing',
+             'pub_date': '2020-01-02T03:04:05Z'},
+        ])
+        comments = self.ndjson('comments.ndjson', [
+            {'post': 1, 'author': 'existing', 'text': 'Комментарий',
+             'created': '2021-01-02T03:04:05Z'},
+        ])
+        fan = User.objects.create_user(username='fan')
+        follows = self.write('follows.csv', 'user,author\nfan,existing\n')
+        call_command(
+            'import_data', follows=follows, posts=posts, comments=comments,
+            stdout=StringIO()
+        )
+        imported = Post.objects.get(text='Новый')
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(user=fan).values_list(
+                'post', flat=True
+            )),
+            {other.pk, imported.pk}
+        )
+        self.assertEqual(imported.comment_count, 1)
+        self.assertEqual(imported.comments.get().created.year, 2021)
+        stats = UserStats.objects.get(user=self.existing)
+        self.assertEqual((stats.posts_count, stats.followers_count), (2, 1))
+        other.refresh_from_db()
+        self.assertEqual(other.comment_count, 5)
+        self.assertTrue(Post._meta.get_field('updated').auto_now)
+        call_command(
+            'import_data', posts=posts, full_rebuild=True, stdout=StringIO()
+        )
+        other.refresh_from_db()
+        self.assertEqual(other.comment_count, 1)
+
+    def test_export_import_round_trip(self):
+        """Выгрузка export_ndjson загружается обратно вместе с группами,
+        датами и комментариями."""
+        group = Group.objects.create(title='Группа', slug='group')
+        post = Post.objects.create(
+            author=self.existing, text='Пост в группе', group=group
+        )
+        Post.objects.filter(pk=post.pk).update(
+            pub_date='2020-01-02T03:04:05Z'
+        )
+        Comment.objects.create(
+            post=post, author=self.existing, text='Комментарий'
+        )
+        path = os.path.join(self.tmp.name, 'export.ndjson')
+        call_command(
+            'export_ndjson', '--comments', output=path, stderr=StringIO()
+        )
+        Post.objects.all().delete()
+        call_command(
+            'import_data', posts=path, comments=path, stdout=StringIO()
+        )
+        imported = Post.objects.get()
+        self.assertEqual(imported.text, 'Пост в группе')
+        self.assertEqual(imported.group, group)
+        self.assertEqual(imported.pub_date.year, 2020)
+        self.assertEqual(imported.comments.get().text, 'Комментарий')
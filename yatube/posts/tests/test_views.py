@@ -1,14 +1,42 @@
+import shutil
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.test import Client, TestCase
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
 from django import forms
 from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
 
-from posts.models import Post, Group, Follow
+from core.querybudget import QUERY_BUDGETS, assert_query_budget
+from posts.bulk import bulk_create_posts
+from posts.caching import CHANGED_KEY
+from posts.models import Comment, Post, Group, Follow
+from posts.thumbnails import wait_for_pending
 
 User = get_user_model()
 
+# Картинки постов и их миниатюры пишутся во временный каталог.
+media = {}
+
+
+def setUpModule():
+    media['root'] = tempfile.mkdtemp()
+    media['settings'] = override_settings(MEDIA_ROOT=media['root'])
+    media['settings'].enable()
+
+
+def tearDownModule():
+    wait_for_pending()
+    media['settings'].disable()
+    shutil.rmtree(media['root'], ignore_errors=True)
+
 
 class TaskPagesTest(TestCase):
     @classmethod
@@ -174,18 +202,47 @@ class TaskPagesTest(TestCase):
     def test_cache_index_page(self):
         """Тест кэширования главной страницы."""
         response1 = self.authorized_client.get(reverse('posts:index'))
-        Post.objects.create(
-            author=self.user,
-            text='test-text',
-            group=self.group
-        )
+        # update() не отправляет сигналов, поэтому фрагмент остается в кэше.
+        Post.objects.filter(pk=self.post.pk).update(text='cached-text')
         response2 = self.authorized_client.get(reverse('posts:index'))
         self.assertEqual(response1.content, response2.content)
         cache.clear()
         response3 = self.authorized_client.get(reverse('posts:index'))
         self.assertNotEqual(response3.content, response1.content)
-        self.assertEqual(response3.context['page_obj'][0].text, 'test-text')
-        self.assertEqual(len(response3.context['page_obj'].object_list), 2)
+
+    def test_cache_invalidated_on_write(self):
+        """Новый пост сразу виден на закэшированных страницах."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user}),
+        )
+        for url in urls:
+            self.authorized_client.get(url)
+        Post.objects.create(
+            author=self.user,
+            text='test-text',
+            group=self.group
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.authorized_client.get(url)
+                self.assertContains(response, 'test-text')
+
+    def test_post_card_cache(self):
+        """Карточка поста общая для читателей, кнопка правки — только
+        у автора, новый комментарий обновляет карточку."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        edit_url = reverse('posts:post_edit', kwargs={'post_id': self.post.id})
+        self.assertContains(self.authorized_client.get(url), edit_url)
+        self.assertNotContains(self.authorized_client2.get(url), edit_url)
+        self.assertNotContains(self.guest_client.get(url), edit_url)
+        Comment.objects.create(
+            post=self.post, author=self.user_following, text='comment'
+        )
+        self.assertContains(
+            self.guest_client.get(url), 'Комментариев: 1'
+        )
 
     def test_follow_to_author(self):
         """"Тест подписки на автора."""
@@ -268,3 +325,263 @@ class PaginatorViewsTest(TestCase):
                     reverse_ + '?page=2').context.get('page_obj')),
                     posts_on_second_page
                 )
+
+    def test_page_beyond_offset_limit_is_not_found(self):
+        """?page= глубже MAX_OFFSET_PAGE — 404, а не первая страница."""
+        url = reverse('posts:index')
+        response = self.unauthorized_client.get(url, {'page': 51})
+        self.assertEqual(response.status_code, 404)
+        response = self.unauthorized_client.get(url, {'page': 50})
+        self.assertEqual(response.status_code, 404)
+
+    def test_page_past_the_end_is_not_found(self):
+        """?page= за концом ленты — 404, а на последней странице нет
+        ссылок с пустым курсором."""
+        url = reverse('posts:index')
+        response = self.unauthorized_client.get(url, {'page': 3})
+        self.assertEqual(response.status_code, 404)
+        response = self.unauthorized_client.get(url, {'page': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Предыдущая')
+        self.assertNotContains(response, 'cursor=None')
+
+    def test_feed_queries_do_not_depend_on_page_size(self):
+        """Число запросов страницы ленты не зависит от числа постов."""
+        for post in Post.objects.all():
+            Comment.objects.create(post=post, author=self.user, text='c')
+        url = reverse('posts:group', kwargs={'slug': self.group.slug})
+        with CaptureQueriesContext(connection) as full_page:
+            self.unauthorized_client.get(url)
+        with CaptureQueriesContext(connection) as short_page:
+            self.unauthorized_client.get(url, {'page': 2})
+        self.assertEqual(len(full_page), len(short_page))
+
+    def test_cursor_pagination(self):
+        """Курсоры next/prev листают ленту без пропусков и повторов."""
+        url = reverse('posts:index')
+        first_page = self.unauthorized_client.get(url).context['page_obj']
+        self.assertIsNone(first_page.previous_cursor)
+        second_page = self.unauthorized_client.get(
+            url, {'cursor': first_page.next_cursor}
+        ).context['page_obj']
+        self.assertEqual(
+            list(first_page) + list(second_page),
+            list(Post.objects.order_by('-pub_date', '-id'))
+        )
+        self.assertFalse(second_page.has_next())
+        back_page = self.unauthorized_client.get(
+            url, {'cursor': second_page.previous_cursor}
+        ).context['page_obj']
+        self.assertEqual(list(back_page), list(first_page))
+        self.assertFalse(back_page.has_previous())
+
+    def test_broken_cursor_returns_first_page(self):
+        """Испорченный курсор отдает первую страницу."""
+        response = self.unauthorized_client.get(
+            reverse('posts:index'), {'cursor': 'broken'}
+        )
+        self.assertEqual(len(response.context['page_obj']), 10)
+        self.assertFalse(response.context['page_obj'].has_previous())
+
+
+class FollowTimelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.old_post = Post.objects.create(author=cls.author, text='старый')
+
+    def setUp(self):
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def get_feed(self):
+        response = self.reader_client.get(reverse('posts:follow_index'))
+        return list(response.context['page_obj'])
+
+    def test_timeline_follow_post_unfollow(self):
+        """Лента дописывается при подписке и публикации, чистится
+        при отписке."""
+        self.reader_client.get(
+            reverse('posts:profile_follow', args=[self.author.username])
+        )
+        self.assertEqual(self.get_feed(), [self.old_post])
+        new_post = Post.objects.create(author=self.author, text='новый')
+        self.assertEqual(self.get_feed(), [new_post, self.old_post])
+        self.reader_client.get(
+            reverse('posts:profile_unfollow', args=[self.author.username])
+        )
+        self.assertEqual(self.get_feed(), [])
+
+
+class SearchViewTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(
+            author=cls.user, text='Котики спят на диване'
+        )
+        cls.other_post = Post.objects.create(
+            author=cls.user, text='Собаки гуляют во дворе'
+        )
+
+    def test_search_finds_by_word_prefix(self):
+        """Поиск находит пост по началу слова без учета регистра."""
+        response = self.client.get(reverse('posts:search'), {'q': 'КОТ'})
+        self.assertEqual(list(response.context['page_obj']), [self.post])
+
+    def test_search_index_follows_edit_and_delete(self):
+        """Индекс обновляется при правке и удалении поста."""
+        self.post.text = 'Птицы поют'
+        self.post.save()
+        response = self.client.get(reverse('posts:search'), {'q': 'птицы'})
+        self.assertEqual(list(response.context['page_obj']), [self.post])
+        self.post.delete()
+        response = self.client.get(reverse('posts:search'), {'q': 'птицы'})
+        self.assertEqual(len(response.context['page_obj']), 0)
+
+    def test_build_search_index(self):
+        """Команда build_search_index индексирует существующие посты."""
+        Post.objects.filter(pk=self.other_post.pk).update(text='Ежики')
+        call_command('build_search_index', stdout=StringIO())
+        response = self.client.get(reverse('posts:search'), {'q': 'ежики'})
+        self.assertEqual(list(response.context['page_obj']), [self.other_post])
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, text='Текст', group=cls.group
+        )
+
+    def setUp(self):
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+
+    def test_not_modified(self):
+        """Неизменные страницы отвечают 304 без рендера, новый
+        комментарий меняет ETag."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group', args=[self.group.slug]),
+            reverse('posts:profile', args=[self.author.username]),
+            reverse('posts:post_detail', args=[self.post.id]),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertIsNone(response.context)
+        etags = {url: self.client.get(url)['ETag'] for url in urls}
+        Comment.objects.create(post=self.post, author=self.author, text='Ок')
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etags[url])
+                self.assertEqual(response.status_code, 200)
+
+    def test_renames_change_etag(self):
+        """Новые название группы и имя автора видны клиентам с ETag."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group', args=[self.group.slug]),
+            reverse('posts:post_detail', args=[self.post.id]),
+        )
+        for rename in (self.rename_group, self.rename_author):
+            etags = {url: self.client.get(url)['ETag'] for url in urls}
+            rename()
+            for url in urls:
+                with self.subTest(url=url):
+                    response = self.client.get(
+                        url, HTTP_IF_NONE_MATCH=etags[url]
+                    )
+                    self.assertEqual(response.status_code, 200)
+
+    def rename_group(self):
+        group = Group.objects.get(pk=self.group.pk)
+        group.title = 'Новое название'
+        group.save()
+
+    def rename_author(self):
+        author = User.objects.get(pk=self.author.pk)
+        author.username = 'writer'
+        author.save()
+
+    def test_delete_moves_last_modified(self):
+        """Удаление поста не дает 304 по If-Modified-Since."""
+        url = reverse('posts:index')
+        post = Post.objects.create(author=self.author, text='Лишний')
+        cache.set(CHANGED_KEY, time.time() - 60, None)
+        last_modified = self.client.get(url)['Last-Modified']
+        self.assertEqual(
+            self.client.get(
+                url, HTTP_IF_MODIFIED_SINCE=last_modified
+            ).status_code,
+            304
+        )
+        post.delete()
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_depends_on_user(self):
+        """Страница автора не отдается анониму по его ETag."""
+        url = reverse('posts:index')
+        etag = self.author_client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class QueryBudgetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание'
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.posts = bulk_create_posts(
+            Post(author=cls.author, group=cls.group, text=f'Пост {i}')
+            for i in range(110)
+        )
+        Comment.objects.create(
+            post=cls.posts[0], author=cls.reader, text='Комментарий'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+
+    def test_pages_within_budget(self):
+        """Число запросов не растет с размером страницы."""
+        pages = (
+            ('posts:index', None),
+            ('posts:follow_index', None),
+            ('posts:group', {'slug': self.group.slug}),
+            ('posts:profile', {'username': self.author.username}),
+            ('posts:post_detail', {'post_id': self.posts[0].id}),
+        )
+        for per_page in (10, 100):
+            for name, kwargs in pages:
+                with self.subTest(name=name, per_page=per_page), \
+                        mock.patch('posts.views.POST_CNT', per_page):
+                    cache.clear()
+                    response = assert_query_budget(self.client, name, kwargs)
+                    self.assertEqual(response.status_code, 200)
+
+    def test_over_budget_logged(self):
+        with mock.patch.dict(QUERY_BUDGETS, {'posts:index': 0}), \
+                self.assertLogs('core.querybudget', 'WARNING') as logs:
+            self.client.get(reverse('posts:index'))
+        self.assertIn('posts:index', logs.output[0])
+        with mock.patch.dict(QUERY_BUDGETS, {'posts:index': 0}):
+            with self.assertRaises(AssertionError):
+                assert_query_budget(self.client, 'posts:index')
@@ -0,0 +1,230 @@
+"""Миниатюры картинок постов: фоновая подготовка и пакетное чтение.
+
+Тег {% thumbnail %} создает миниатюру при первом показе поста, и этот
+запрос ждет обработку картинки. Поэтому сразу после сохранения картинки
+все нужные шаблонам размеры строятся в фоновом пуле потоков процесса, а
+команда pregenerate_thumbnails готовит их для уже загруженных постов.
+
+Кроме того, каждый тег {% thumbnail %} отдельно ищет готовую миниатюру в
+KV-store sorl. prefetch_thumbnails находит миниатюры всех постов страницы
+одним get_many к кэшу и одним запросом к БД для промахов.
+
+Вместе с миниатюрами в том же пуле строятся версии картинки для srcset
+(posts.images); когда они готовы, у постов ставится image_variants.
+Картинка без ссылающихся постов удаляется с миниатюрами и версиями.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from core import metrics
+from django.db import close_old_connections, connections, transaction
+from sorl.thumbnail import default, delete, get_thumbnail
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import (
+    EMPTY_VALUE, KVStore as CachedDBKVStore
+)
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from . import storage
+from .caching import bump_generation
+from .images import delete_variants, write_variants
+from .models import Post
+from .storage import post_images
+
+logger = logging.getLogger(__name__)
+
+# Размеры и параметры всех тегов {% thumbnail %} в шаблонах постов;
+# должны совпадать с posts/includes/post_item.html.
+THUMBNAIL_SIZES = (
+    ('960x339', {'crop': 'center', 'upscale': True}),
+)
+THUMBNAIL_WORKERS = 2
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=THUMBNAIL_WORKERS,
+            thread_name_prefix='thumbnails'
+        )
+    return _executor
+
+
+def image_file(image_name):
+    # Ключ KV-store зависит от хранилища: то же, что у поля Post.image.
+    return ImageFile(image_name, post_images)
+
+
+def wait_for_pending():
+    """Дожидается всех задач пула, например перед удалением MEDIA_ROOT."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
+
+
+def generate_thumbnails(image_name):
+    """Строит все миниатюры картинки, ошибки только пишет в лог."""
+    start = time.perf_counter()
+    try:
+        for geometry, options in THUMBNAIL_SIZES:
+            get_thumbnail(image_file(image_name), geometry, **options)
+    except Exception:
+        logger.exception('Не удалось построить миниатюры %s', image_name)
+    else:
+        metrics.observe(
+            'yatube_thumbnail_generation_seconds',
+            time.perf_counter() - start
+        )
+    finally:
+        close_old_connections()
+
+
+def process_image(image_name):
+    """Миниатюры и версии для srcset одной картинки."""
+    generate_thumbnails(image_name)
+    try:
+        write_variants(image_name)
+        Post.objects.filter(image=image_name).update(image_variants=True)
+    except Exception:
+        logger.exception('Не удалось построить версии %s', image_name)
+        return
+    finally:
+        close_old_connections()
+    # update() не шлет сигналов, а фрагменты лент должны получить srcset.
+    bump_generation()
+
+
+def _generate_in_thread(image_name):
+    try:
+        process_image(image_name)
+    finally:
+        # Поток пула живет долго: соединение с БД закрываем сразу.
+        connections.close_all()
+
+
+def queue_thumbnails(post):
+    """Ставит миниатюры картинки поста в очередь после коммита."""
+    if not post.image:
+        return
+    image_name = post.image.name
+    transaction.on_commit(
+        lambda: get_executor().submit(_generate_in_thread, image_name)
+    )
+
+
+def delete_unreferenced(image_name):
+    """Удаляет картинку, ее миниатюры и версии, если на нее нет постов.
+
+    Недавно загруженную картинку может ждать пост из еще не завершенной
+    транзакции: проверка повторяется через storage.REUSE_GRACE.
+    """
+    with post_images.names_lock():
+        if post_images.reused_recently(image_name):
+            retry_delete(image_name)
+            return
+        if Post.objects.filter(image=image_name).exists():
+            return
+        try:
+            delete(image_file(image_name))
+            delete_variants(image_name)
+        except Exception:
+            # Пост уже удален или изменен, уборка не должна ему мешать.
+            logger.exception('Не удалось удалить картинку %s', image_name)
+
+
+def _delete_in_thread(image_name):
+    try:
+        delete_unreferenced(image_name)
+    finally:
+        connections.close_all()
+
+
+def retry_delete(image_name):
+    timer = threading.Timer(
+        storage.REUSE_GRACE, _delete_in_thread, [image_name]
+    )
+    timer.daemon = True
+    timer.start()
+
+
+def release_image(image_name):
+    """Пост больше не ссылается на картинку: проверка после коммита."""
+    if image_name:
+        transaction.on_commit(lambda: delete_unreferenced(image_name))
+
+
+def thumbnail_file(image_name, geometry, options):
+    """Миниатюра с тем же именем и ключом, что выдаст get_thumbnail().
+
+    Повторяет нормализацию параметров ThumbnailBackend.get_thumbnail без
+    обращения к файлам и KV-store.
+    """
+    backend = default.backend
+    source = image_file(image_name)
+    options = dict(options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(default_settings, attr):
+            options.setdefault(key, value)
+    name = backend._get_thumbnail_filename(source, geometry, options)
+    return ImageFile(name, default.storage)
+
+
+def get_many_raw(raw_keys):
+    """Значения KV-store sorl для списка ключей за одно обращение."""
+    kvstore = default.kvstore
+    if not isinstance(kvstore, CachedDBKVStore):
+        values = {key: kvstore._get_raw(key) for key in raw_keys}
+        return {key: value for key, value in values.items() if value}
+    values = kvstore.cache.get_many(raw_keys)
+    missing = [key for key in raw_keys if key not in values]
+    if missing:
+        found = dict(
+            KVStoreModel.objects.filter(key__in=missing).values_list(
+                'key', 'value'
+            )
+        )
+        # Как и sorl, запоминаем отсутствие ключа, чтобы не ходить в БД.
+        kvstore.cache.set_many(
+            {key: found.get(key, EMPTY_VALUE) for key in missing},
+            sorl_settings.THUMBNAIL_CACHE_TIMEOUT
+        )
+        values.update(found)
+    return {
+        key: value for key, value in values.items()
+        if value is not EMPTY_VALUE
+    }
+
+
+def prefetch_thumbnails(posts):
+    """Готовые миниатюры постов {(имя картинки, геометрия): ImageFile}.
+
+    Миниатюр, которых еще нет, в результате нет: их построит обычный
+    тег {% thumbnail %}.
+    """
+    wanted = {}
+    for post in posts:
+        if not post.image:
+            continue
+        for geometry, options in THUMBNAIL_SIZES:
+            thumbnail = thumbnail_file(post.image.name, geometry, options)
+            wanted[add_prefix(thumbnail.key)] = (post.image.name, geometry)
+    if not wanted:
+        return {}
+    return {
+        wanted[key]: deserialize_image_file(value)
+        for key, value in get_many_raw(list(wanted)).items()
+    }
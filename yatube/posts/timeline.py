@@ -0,0 +1,127 @@
+"""Лента подписок, материализованная при записи (fan-out on write).
+
+Каждый новый пост раскладывается в TimelineEntry всех подписчиков автора,
+при подписке в ленту дописываются посты автора, при отписке — удаляются.
+Чтение ленты сводится к одному запросу по индексу (user, pub_date, post).
+"""
+from itertools import islice
+
+from django.db import connection, transaction
+
+from .models import Follow, Post, TimelineEntry
+
+TIMELINE_BATCH_SIZE = 500
+
+
+def batches(iterable, size=TIMELINE_BATCH_SIZE):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def fan_out_post(post):
+    """Добавляет пост в ленты всех подписчиков автора пачками."""
+    fan_out_posts([post])
+
+
+def fan_out_posts(posts):
+    """Раскладывает посты по лентам подписчиков их авторов.
+
+    Подписчики всех авторов выбираются одним запросом.
+    """
+    posts_by_author = {}
+    for post in posts:
+        posts_by_author.setdefault(post.author_id, []).append(post)
+    if not posts_by_author:
+        return
+    follows = Follow.objects.filter(
+        author_id__in=posts_by_author
+    ).values_list('user_id', 'author_id').iterator()
+    entries = (
+        TimelineEntry(
+            user_id=user_id,
+            post_id=post.id,
+            author_id=author_id,
+            pub_date=post.pub_date,
+        )
+        for user_id, author_id in follows
+        for post in posts_by_author[author_id]
+    )
+    for batch in batches(entries):
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def backfill(user_id, author_id):
+    """Дописывает в ленту подписчика все посты автора."""
+    posts = Post.objects.filter(
+        author_id=author_id
+    ).values_list('id', 'pub_date').iterator()
+    for batch in batches(posts):
+        TimelineEntry.objects.bulk_create(
+            [
+                TimelineEntry(
+                    user_id=user_id,
+                    post_id=post_id,
+                    author_id=author_id,
+                    pub_date=pub_date,
+                )
+                for post_id, pub_date in batch
+            ],
+            ignore_conflicts=True
+        )
+
+
+def trim(user_id, author_id):
+    """Убирает из ленты подписчика посты автора."""
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def _insert_entries_sql(condition='', ignore_conflicts=False):
+    """INSERT ... SELECT записей лент по парам подписка-пост автора."""
+    ops = connection.ops
+    return (
+        f'{ops.insert_statement(ignore_conflicts=ignore_conflicts)} '
+        f'{TimelineEntry._meta.db_table} '
+        '(user_id, post_id, author_id, pub_date) '
+        'SELECT DISTINCT follow.user_id, post.id, post.author_id, '
+        'post.pub_date '
+        f'FROM {Follow._meta.db_table} follow '
+        f'JOIN {Post._meta.db_table} post '
+        f'ON post.author_id = follow.author_id {condition} '
+        f'{ops.ignore_conflicts_suffix_sql(ignore_conflicts=ignore_conflicts)}'
+    )
+
+
+def rebuild():
+    """Строит все ленты заново одним INSERT ... SELECT, возвращает число
+    записей. Нужна после массовой загрузки мимо сигналов."""
+    with transaction.atomic(), connection.cursor() as cursor:
+        TimelineEntry.objects.all().delete()
+        cursor.execute(_insert_entries_sql())
+        return cursor.rowcount
+
+
+def add_entries(post_ids=(), follow_ids=()):
+    """Дописывает в ленты посты post_ids и посты авторов из подписок
+    follow_ids, возвращает число новых записей.
+
+    Как rebuild, но только для загруженного мимо сигналов: INSERT ...
+    SELECT пачками id, уже существующие записи пропускаются.
+    """
+    added = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        for column, ids in (('post.id', post_ids), ('follow.id', follow_ids)):
+            for batch in batches(ids):
+                placeholders = ', '.join(['%s'] * len(batch))
+                cursor.execute(
+                    _insert_entries_sql(
+                        f'WHERE {column} IN ({placeholders})',
+                        ignore_conflicts=True
+                    ),
+                    batch
+                )
+                added += cursor.rowcount
+    return added
@@ -0,0 +1,43 @@
+from functools import wraps
+
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+
+from . import images
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загрузку во временный файл кусками, а не в память воркера.
+
+    Байты сверх images.MAX_UPLOAD_SIZE не записываются: остаток запроса
+    читается вхолостую, а размер файла остается настоящим, и
+    images.validate_image отклоняет его с понятной ошибкой. Поэтому
+    обработчик ставится только для загрузок картинок постов
+    (image_uploads, PostViewSet), а не через FILE_UPLOAD_HANDLERS.
+    """
+
+    def receive_data_chunk(self, raw_data, start):
+        if start < images.MAX_UPLOAD_SIZE:
+            self.file.write(raw_data[:images.MAX_UPLOAD_SIZE - start])
+
+
+def use_image_handler(request):
+    """Ставит ImageUploadHandler, пока тело запроса еще не прочитано."""
+    request.upload_handlers = [ImageUploadHandler(request)]
+
+
+def image_uploads(view):
+    """View с картинкой поста в форме.
+
+    CsrfViewMiddleware читает request.POST до view, после этого сменить
+    обработчики загрузки нельзя. Поэтому CSRF проверяется уже здесь, как
+    советует документация Django.
+    """
+    protected = csrf_protect(view)
+
+    @csrf_exempt
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        use_image_handler(request)
+        return protected(request, *args, **kwargs)
+    return wrapped
@@ -1,13 +1,30 @@
+from core.querybudget import register_budgets
 from django.urls import path
 
 from . import views
 
 app_name = 'posts'
 
+# Сколько SQL-запросов может сделать страница при любом размере ленты
+# (core.querybudget): N+1 в шаблоне карточки сразу выходит за бюджет.
+QUERY_BUDGETS = {
+    'index': 4,
+    'group': 5,
+    'group_list': 2,
+    'search': 4,
+    'profile': 6,
+    'post_detail': 5,
+    'post_create': 4,
+    'post_edit': 5,
+    'follow_index': 5,
+}
+register_budgets(QUERY_BUDGETS, namespace=app_name)
+
 urlpatterns = [
     path('', views.index, name='index'),
     path('group/<slug:slug>/', views.group_posts, name='group'),
     path('group_list.html', views.group_list, name='group_list'),
+    path('search/', views.search, name='search'),
     # Профайл пользователя
     path('profile/<str:username>/', views.profile, name='profile'),
     # Просмотр записи
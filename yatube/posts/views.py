@@ -4,57 +4,108 @@ from django.core.paginator import Paginator
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 
+from .caching import feed_cache_context
+from .conditional import conditional_page, generation_state
+from .counters import user_stats
 from .forms import PostForm, CommentForm
-from .models import Group, Post, Comment, Follow
+from .models import (
+    Group, Post, Comment, Follow, TimelineEntry, UserStats
+)
+from .paginators import paginate
+from .search import search_posts
+from .thumbnails import queue_thumbnails
+from .uploads import image_uploads
 
 User = get_user_model()
 POST_CNT = 10
 
 
-def index(request):
-    post_list = Post.objects.all().order_by('-pub_date')
+def index_state(request):
+    return generation_state()
+
+
+def group_state(request, slug):
+    return generation_state()
+
+
+def profile_state(request, username):
+    # Подписки номер поколения не меняют. Last-Modified не отдается:
+    # время последнего изменения не учитывает новых подписчиков.
+    return generation_state(
+        last_modified=None,
+        followers=UserStats.objects.filter(
+            user__username=username
+        ).values_list('followers_count', flat=True).first(),
+    )
+
+
+def post_state(request, post_id):
+    return generation_state()
 
-    paginator = Paginator(post_list, POST_CNT)
 
-    page_number = request.GET.get('page')
+def follow_state(request):
+    # Подписка и отписка меняют ленту, но не номер поколения.
+    return generation_state(
+        following=UserStats.objects.filter(
+            user=request.user
+        ).values_list('following_count', flat=True).first(),
+    )
+
+
+@conditional_page(index_state)
+def index(request):
+    post_list = Post.objects.feed()
     title = 'Главная страница'
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(request, post_list, POST_CNT)
     context = {
         'page_obj': page_obj,
         'title': title,
+        **feed_cache_context(),
     }
     return render(request, 'posts/index.html', context)
 
 
+@conditional_page(group_state)
 def group_posts(request, slug):
 
     group = get_object_or_404(Group, slug=slug)
-    posts = Post.objects.filter(group=group).order_by('-pub_date')
-    paginator = Paginator(posts, POST_CNT)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    posts = Post.objects.feed().filter(group=group)
+    page_obj = paginate(request, posts, POST_CNT)
     title = 'Посты группы ' + str(group)
     context = {
         'group': group,
         'posts': posts,
         'page_obj': page_obj,
         'title': title,
+        **feed_cache_context(),
     }
     return render(request, 'posts/group.html', context)
 
 
+def search(request):
+    query = request.GET.get('q', '').strip()
+    results = search_posts(query) if query else []
+    paginator = Paginator(results, POST_CNT)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    context = {
+        'page_obj': page_obj,
+        'query': query,
+        'title': 'Поиск',
+    }
+    return render(request, 'posts/search.html', context)
+
+
 def group_list(request):
     template = 'posts/group_list.html'
     return render(request, template)
 
 
+@conditional_page(profile_state)
 def profile(request, username):
-    author = User.objects.get(username=username)
-    posts = Post.objects.filter(author=author).order_by('-pub_date')
-    paginator = Paginator(posts, POST_CNT)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    count = Post.objects.filter(author=author).count()
+    author = User.objects.select_related('stats').get(username=username)
+    posts = Post.objects.feed().filter(author=author)
+    page_obj = paginate(request, posts, POST_CNT)
+    count = user_stats(author).posts_count
     title = 'Профайл пользователя ' + str(author)
     context = {
         'page_obj': page_obj,
@@ -62,6 +113,7 @@ def profile(request, username):
         'count': count,
         'title': title,
         'following': False,
+        **feed_cache_context(),
     }
     if request.user.is_authenticated:
         following = Follow.objects.filter(
@@ -74,15 +126,18 @@ def profile(request, username):
     return render(request, 'posts/profile.html', context)
 
 
+@conditional_page(post_state)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(
+        Post.objects.feed().select_related('author__stats'), pk=post_id
+    )
     text = post.text
     title = text[:30]
     pub_date = post.pub_date
     author = post.author
-    count_posts = author.posts.all().count()
+    count_posts = user_stats(author).posts_count
     group = post.group
-    comments = Comment.objects.filter(post=post_id)
+    comments = Comment.objects.filter(post=post_id).select_related('author')
     form = CommentForm(request.POST or None)
     context = {
         'text': text,
@@ -99,6 +154,7 @@ def post_detail(request, post_id):
 
 
 @login_required
+@image_uploads
 def post_create(request):
     author = get_object_or_404(User, username=request.user)
     form = PostForm(
@@ -110,12 +166,14 @@ def post_create(request):
             deform = form.save(commit=False)
             deform.author = author
             deform.save()
+            queue_thumbnails(deform)
             return redirect("posts:profile", username=author)
     context = {"form": form}
     return render(request, "posts/post_create.html", context)
 
 
 @login_required
+@image_uploads
 def post_edit(request, post_id):
     author = get_object_or_404(User, username=request.user)
     post = get_object_or_404(Post, id=post_id)
@@ -131,6 +189,8 @@ def post_edit(request, post_id):
             deform = form.save(commit=False)
             deform.author = author
             deform.save()
+            if 'image' in form.changed_data:
+                queue_thumbnails(deform)
             return redirect("posts:post_detail", post_id=post_id)
     context = {"form": form, "is_edit": True}
     return render(request, "posts/post_create.html", context)
@@ -155,19 +215,22 @@ def add_comment(request, post_id):
 
 
 @login_required
+@conditional_page(follow_state)
 def follow_index(request):
-    authors_list = Follow.objects.filter(
-        user=request.user
-    ).values_list('author')
-    post_list = Post.objects.filter(
-        author__in=authors_list
-    ).order_by('-pub_date')
-    paginator = Paginator(post_list, POST_CNT)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Лента материализована в TimelineEntry: читаем ее по индексу
+    # (user, pub_date, post) без объединения с подписками.
+    entries = TimelineEntry.objects.filter(user=request.user)
+    page_obj = paginate(request, entries, POST_CNT, id_field='post_id')
+    posts = Post.objects.feed().in_bulk(
+        [entry.post_id for entry in page_obj]
+    )
+    page_obj.object_list = [
+        posts[entry.post_id] for entry in page_obj
+        if entry.post_id in posts
+    ]
     context = {
         'page_obj': page_obj,
-        'paginator': paginator,
+        'paginator': page_obj.paginator,
     }
     return render(request, 'posts/follow.html', context)
 
@@ -62,16 +62,42 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первым: профиль запроса охватывает и остальные middleware.
+    'core.profiling.ProfilingMiddleware',
+    'core.metrics.MetricsMiddleware',
+    'core.slowqueries.SlowQueryMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # Первым после security: в счет входят и запросы сессий и auth.
+    'core.querybudget.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
 ]
 
+if DEBUG:
+    MIDDLEWARE.append('debug_toolbar.middleware.DebugToolbarMiddleware')
+
+# Профилирование по требованию (core.profiling): запросы с токеном из
+# manage.py profile_token в заголовке X-Profile и доля случайных.
+PROFILE_SAMPLE_RATE = 0
+PROFILE_DIR = os.path.join(BASE_DIR, 'profiles')
+PROFILE_KEEP = 100
+PROFILE_TOKEN_MAX_AGE = 60 * 60 * 24
+
+# Метрики Prometheus (core.metrics): счетчики всех воркеров хоста
+# складываются в один файл не реже раза в METRICS_FLUSH_INTERVAL секунд.
+METRICS_DATABASE = os.path.join(BASE_DIR, 'metrics.sqlite3')
+METRICS_FLUSH_INTERVAL = 5
+METRICS_ALLOWED_IPS = ['127.0.0.1']
+
+# Журнал медленных SQL-запросов (core.slowqueries, manage.py slow_queries).
+SLOW_QUERY_MS = 100
+SLOW_QUERY_LOG = os.path.join(BASE_DIR, 'slow_queries.log')
+SLOW_QUERY_LOG_MAX_BYTES = 5 * 1024 * 1024
+
 ROOT_URLCONF = 'yatube.urls'
 
 TEMPLATES = [
@@ -167,8 +193,15 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Кэш в файле SQLite общий для всех воркеров на хосте
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
     }
 }
+# Тесты работают с кэшем во временном каталоге (core.testrunner).
+TEST_RUNNER = 'core.testrunner.TestRunner'